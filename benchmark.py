@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+'''
+Benchmarks for the parts of the program that can run without a display.
+
+    python3 benchmark.py debugger   -- overhead of the @debugger decorator
+    python3 benchmark.py import     -- time each stage of importing generated PayPal files
+
+The import benchmark needs the en_US.UTF-8 locale, the same as the program.
+'''
+import sys, os, time, json, shutil, tempfile, platform, locale, argparse
+import sqlite3 as sql
+import utility
+from utility import Logger, debugger, base_decorator
+from database import Database
+from importer import ImportPayPal
+from paypal_gen import PayPalGenerator, add_arguments
+
+@base_decorator
+def legacy_debugger(func):
+    '''
+    The @debugger decorator as it was before it checked the logging level. It is
+    only used as the reference for the debugger benchmark.
+    '''
+    def wrapper(*args, **kwargs):
+        args[0].logger.debugger(func.__name__, "-- enter")
+        retv = func(*args, **kwargs)
+        args[0].logger.debugger(func.__name__, "-- returning: %s"%(str(retv)))
+        return retv
+
+    return wrapper
+
+class HelperBench(object):
+    '''
+    Stand in for a Database helper. The query returns a small row list, which is
+    what the old decorator turned into a string on every call.
+    '''
+
+    def __init__(self, level, rows=50):
+        self.logger = Logger(self, level)
+        self.db = sql.connect(':memory:')
+        self.db.execute('CREATE TABLE Item (ID INTEGER PRIMARY KEY, name TEXT);')
+        self.db.executemany('INSERT INTO Item (name) VALUES (?);', [('item %d'%(x),) for x in range(rows)])
+
+    def query(self):
+        return self.db.execute('SELECT * FROM Item;').fetchall()
+
+def time_calls(func, obj, calls):
+    '''
+    Return the average time of one call in microseconds.
+    '''
+    start = time.perf_counter()
+    for x in range(calls):
+        func(obj)
+    return (time.perf_counter() - start) / calls * 1000000
+
+def bench_debugger(calls, repeats=5):
+    '''
+    Compare the cost of calling a helper with no decorator, with the old decorator,
+    with the decorator when the level is above DEBUG and with the decorator when it
+    was turned off when the method was decorated.
+
+    Every case is run once to warm up and then timed repeats times, taking turns so
+    that a slow moment affects all of them alike. The best time of each case is used,
+    and the overhead is measured against the best time of the undecorated case.
+    '''
+    obj = HelperBench(Logger.INFO)
+
+    enabled = utility.DEBUGGER_ENABLED
+    utility.DEBUGGER_ENABLED = True
+    current = debugger(HelperBench.query)
+    utility.DEBUGGER_ENABLED = False
+    disabled = debugger(HelperBench.query)
+    utility.DEBUGGER_ENABLED = enabled
+
+    cases = [('undecorated', HelperBench.query),
+             ('legacy @debugger', legacy_debugger(HelperBench.query)),
+             ('@debugger, level INFO', current),
+             ('@debugger, disabled', disabled)]
+
+    for name, func in cases:
+        time_calls(func, obj, calls)
+
+    best = [None]*len(cases)
+    for x in range(repeats):
+        for idx, (name, func) in enumerate(cases):
+            usec = time_calls(func, obj, calls)
+            if best[idx] is None or usec < best[idx]:
+                best[idx] = usec
+
+    base = best[0]
+    print('%-24s %12s %12s'%('case', 'usec/call', 'overhead'))
+    for (name, func), usec in zip(cases, best):
+        print('%-24s %12.2f %12.2f'%(name, usec, usec - base))
+
+def timed_stage(name, func, times):
+    '''
+    Wrap an import stage so that the time it takes is saved in times under its name.
+    '''
+    def wrapper():
+        start = time.perf_counter()
+        retv = func()
+        times[name] = time.perf_counter() - start
+        return retv
+
+    return wrapper
+
+def import_file(fname, processes):
+    '''
+    Import a file into the database in the current directory with the stages timed.
+    A worker Database object is used so that there can be a new database for each
+    run. Returns the stage times, the total time and the counts of what was imported.
+    '''
+    data = Database.worker_instance()
+    imp = ImportPayPal(fname, data)
+    if not processes is None:
+        imp.processes = processes
+
+    times = {}
+    imp.stages = [(name, timed_stage(name, func, times)) for name, func in imp.stages]
+    start = time.perf_counter()
+    imp.import_all()
+    total = time.perf_counter() - start
+
+    counts = {'accepted': imp.accepted, 'rejected': imp.rejected}
+    for table in ['RawImport', 'Country', 'Customer', 'Vendor', 'SaleRecord', 'PurchaseRecord']:
+        counts[table] = data.get_count(table)
+    data.close()
+    return times, total, counts
+
+def bench_import(args):
+    '''
+    Generate a PayPal file of each size and import it into a new database. Each run
+    is in a directory of its own that has a copy of the SQL files that make the
+    database. The results are printed and written to a JSON file.
+    '''
+    try:
+        locale.setlocale(locale.LC_ALL, 'en_US.UTF-8')
+    except locale.Error:
+        print('The import benchmark needs the en_US.UTF-8 locale.')
+        return 1
+
+    # the messages from the importer would be mixed in with the results
+    if not 'ACCOUNTING_LOG' in os.environ:
+        utility.LOG_LEVELS['default'] = Logger.WARNING
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    output = os.path.abspath(args.output)
+    if args.dir is None:
+        base = tempfile.mkdtemp(prefix='import_bench_')
+    else:
+        base = os.path.abspath(args.dir)
+        os.makedirs(base, exist_ok=True)
+
+    results = {
+        'benchmark': 'import',
+        'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'sqlite': sql.sqlite_version,
+        'cpus': os.cpu_count(),
+        'options': {'customers': args.customers, 'vendors': args.vendors,
+                    'duplicates': args.duplicates, 'credit': args.credit,
+                    'seed': args.seed, 'processes': args.processes},
+        'runs': []}
+
+    cwd = os.getcwd()
+    try:
+        for rows in args.rows:
+            work = os.path.join(base, 'rows_%d'%(rows))
+            if os.path.isdir(work):
+                shutil.rmtree(work)
+            os.makedirs(work)
+            for name in ['database.sql', 'populate.sql']:
+                shutil.copy(os.path.join(here, name), work)
+
+            fname = os.path.join(work, 'paypal.csv')
+            start = time.perf_counter()
+            gen = PayPalGenerator(rows, args.customers, args.vendors, args.duplicates, args.credit, args.seed)
+            written = gen.write(fname)
+            generate = time.perf_counter() - start
+
+            os.chdir(work)
+            try:
+                times, total, counts = import_file(fname, args.processes)
+            finally:
+                os.chdir(cwd)
+
+            results['runs'].append({
+                'rows': rows,
+                'file_bytes': written['bytes'],
+                'credits': written['credits'],
+                'debits': written['debits'],
+                'duplicates': written['duplicates'],
+                'generate_sec': generate,
+                'stages_sec': times,
+                'total_sec': total,
+                'read_rows_per_sec': rows / times['Reading file'] if times['Reading file'] > 0 else 0.0,
+                'counts': counts})
+
+            print('%d rows, %.1f MB'%(rows, written['bytes'] / 1048576))
+            for name, sec in times.items():
+                print('    %-16s %10.3f sec'%(name, sec))
+            print('    %-16s %10.3f sec'%('total', total))
+
+            if not args.keep:
+                shutil.rmtree(work)
+    finally:
+        if args.dir is None and not args.keep:
+            shutil.rmtree(base, ignore_errors=True)
+
+    with open(output, 'w') as fh:
+        json.dump(results, fh, indent=4)
+    print('results written to %s'%(output))
+    return 0
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the benchmarks.')
+    parser.add_argument('bench', choices=['debugger', 'import'], help='benchmark to run')
+    parser.add_argument('--calls', type=int, default=20000, help='number of calls to time')
+    parser.add_argument('--repeats', type=int, default=5, help='number of times to time each case, the best is used')
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 1000000],
+                        help='sizes of the files to import')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='number of processes that parse a large file (default is the number of CPUs)')
+    parser.add_argument('--output', default='import_bench.json', help='file to write the import results to')
+    parser.add_argument('--dir', default=None, help='directory to do the imports in (default is a temporary one)')
+    parser.add_argument('--keep', action='store_true', help='keep the generated files and databases')
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    if args.bench == 'debugger':
+        bench_debugger(args.calls, args.repeats)
+    elif args.bench == 'import':
+        sys.exit(bench_import(args))
@@ -3,7 +3,7 @@ import sys, os, time
 import tkinter as tk
 import tkinter.ttk as ttk
 from database import Database
-from utility import Logger, debugger
+from utility import Logger, get_logger, debugger
 
 class DirectoryBrowser(tk.Frame):
 
@@ -12,7 +12,7 @@ class DirectoryBrowser(tk.Frame):
     GB = MB * KB
 
     def __init__(self, master, **kw):
-        self.logger = Logger(self, Logger.DEBUG)
+        self.logger = get_logger(self)
         self.logger.debug(sys._getframe().f_code.co_name)
 
         super().__init__(master, **kw)
@@ -133,11 +133,12 @@ class DirectoryBrowser(tk.Frame):
 class ProductLine(tk.Frame):
 
     def __init__(self, owner, idx, prod_idx, quan, **kargs):
-        self.logger = Logger(self, Logger.DEBUG)
+        self.logger = get_logger(self)
         self.logger.debug(sys._getframe().f_code.co_name)
         super().__init__(owner, **kargs)
 
         self.data = Database.get_instance()
+        self.version = None
 
         tk.Label(self, text=str(idx)).grid(row=0, column=0)
         self.spin_value = tk.StringVar(self)
@@ -172,15 +173,18 @@ class ProductLine(tk.Frame):
     @debugger
     def populate(self):
         '''
-        Populate the combo box with the list of products.
+        Populate the combo box with the list of products. The list is shared by all of
+        the lines and is only read again when the inventory changes.
         '''
-        lst = self.data.populate_list('InventoryItem', 'name')
-        self.combo['values'] = lst
+        version = self.data.get_table_version('InventoryItem')
+        if self.version != version:
+            self.combo['values'] = self.data.get_ref_names('InventoryItem', 'name')
+            self.version = version
 
 class ProductWidget(tk.Frame):
 
     def __init__(self, owner, sale_id, **kargs):
-        self.logger = Logger(self, Logger.DEBUG)
+        self.logger = get_logger(self)
         self.logger.debug(sys._getframe().f_code.co_name)
         super().__init__(owner, **kargs)
 
@@ -205,14 +209,20 @@ class ProductWidget(tk.Frame):
         self.populate()
 
     @debugger
-    def get_prod_list(self):
+    def get_prod_list(self, products=None):
+        '''
+        Create the product lines. The products are a list of (inventory_ID, quantity)
+        tuples. If they are not given, then they are read from the database.
+        '''
+        if products is None:
+            products = [(item['inventory_ID'], item['quantity'])
+                        for item in self.data.iter_rows_by_col('ProductList', 'sale_record_ID', self.sale_id)]
 
-        self.products_list = self.data.get_row_list_by_col('ProductList', 'sale_record_ID', self.sale_id)
-        if not self.products_list is None:
-            for idx, item in enumerate(self.products_list):
-                line = ProductLine(self.ctl_frame, idx+1, item['inventory_ID'], item['quantity'])
-                self.line_widgets.append(line)
-        else:
+        for idx, item in enumerate(products):
+            line = ProductLine(self.ctl_frame, idx+1, item[0], item[1])
+            self.line_widgets.append(line)
+
+        if len(self.line_widgets) == 0:
             line = ProductLine(self.ctl_frame, 1, 1, 1)
             self.line_widgets.append(line)
 
@@ -241,12 +251,12 @@ class ProductWidget(tk.Frame):
             retv.append(item.get())
 
     @debugger
-    def set(self, sale_id):
+    def set(self, sale_id, products=None):
         self.sale_id = sale_id
         self.forget()
         del self.line_widgets
         self.line_widgets = []
-        self.get_prod_list()
+        self.get_prod_list(products)
         self.populate()
 
     @debugger
@@ -263,17 +273,17 @@ class ProductWidget(tk.Frame):
 
     @debugger
     def save_btn(self):
-        # delete the currently existing records
-        self.data.delete_where('ProductList', 'sale_record_ID=%d'%(self.sale_id))
-        for item in self.line_widgets:
-            val = item.get()
-            if val['quan'] > 0:
-                self.data.insert_row('ProductList', {'sale_record_ID':self.sale_id,
-                                                    'inventory_ID':val['value'],
-                                                    'quantity':val['quan']})
+        with self.data.transaction():
+            # delete the currently existing records
+            self.data.delete_where('ProductList', 'sale_record_ID=?', (self.sale_id,))
+            for item in self.line_widgets:
+                val = item.get()
+                if val['quan'] > 0:
+                    self.data.insert_row('ProductList', {'sale_record_ID':self.sale_id,
+                                                        'inventory_ID':val['value'],
+                                                        'quantity':val['quan']})
         # TODO: If there are 2 or more items with the same inventory ID, add the
         # quantities together instead of saving two database rows.
-        self.data.commit()
         self.forget()
         self.populate()
 
@@ -285,3 +295,245 @@ class ProductWidget(tk.Frame):
         line = ProductLine(self.ctl_frame, 1, 1, 1)
         self.line_widgets.append(line)
         self.populate()
+
+class RecordWindow(object):
+    '''
+    The rows of a table that are in view, sorted by a column and then by ID. Only
+    size rows are kept. When the position of the first row changes by less than a
+    window, the rows next to the ones that are kept are read by key. Otherwise the
+    window is read again from the new position.
+    '''
+
+    def __init__(self, data, table, columns, size=25):
+        self.data = data
+        self.table = table
+        self.columns = columns
+        self.size = size
+        self.order_col = 'ID'
+        self.desc = False
+        self.count = 0 # rows in the table
+        self.top = 0 # position in the table of the first row in the window
+        self.rows = []
+
+    def key(self, row):
+        return (row[self.order_col], row['ID'])
+
+    def refresh(self):
+        '''
+        Count the rows again and read the window from the start of the table.
+        '''
+        self.count = self.data.get_count(self.table)
+        self.top = 0
+        self.rows = []
+        self.move_to(0)
+
+    def move_to(self, top):
+        '''
+        Move the window so that it starts at the given position in the table. Returns
+        True if the rows in the window changed.
+        '''
+        top = max(0, min(top, self.count - self.size))
+        delta = top - self.top
+        if delta == 0 and len(self.rows) > 0:
+            return False
+
+        if len(self.rows) > 0 and 0 < delta < len(self.rows):
+            rows = self.data.get_page(self.table, self.columns, self.order_col,
+                                      self.key(self.rows[-1]), delta, self.desc)
+            self.rows = self.rows[delta:] + rows
+        elif len(self.rows) > 0 and -len(self.rows) < delta < 0:
+            # the rows before the window, read in the opposite order
+            rows = self.data.get_page(self.table, self.columns, self.order_col,
+                                      self.key(self.rows[0]), -delta, not self.desc)
+            rows.reverse()
+            self.rows = rows + self.rows[:delta]
+        else:
+            self.rows = self.data.get_page(self.table, self.columns, self.order_col,
+                                           None, self.size, self.desc, top)
+        self.top = top
+        return True
+
+class RecordBrowser(tk.Frame):
+    '''
+    Shows the rows of a table in a grid. The grid only holds the rows that are in
+    view and they are read again as it is scrolled, so a large table can be browsed
+    without reading all of it. The scroll bar covers the whole table. Clicking a
+    column heading sorts on that column in the database. Selecting a row calls the
+    command with its ID.
+    '''
+
+    def __init__(self, owner, table, columns, headings=None, command=None, rows=25, **kargs):
+        self.logger = get_logger(self)
+        self.logger.debug(sys._getframe().f_code.co_name)
+        super().__init__(owner, **kargs)
+
+        self.window = RecordWindow(Database.get_instance(), table, columns, rows)
+        self.columns = columns
+        self.command = command
+        # ID of the row that was selected last
+        self.current = None
+
+        if headings is None:
+            headings = columns
+
+        self.tree = ttk.Treeview(self, columns=self.columns, show='headings', selectmode='browse', height=rows)
+        self.ysb = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self.yview)
+
+        for col, text in zip(self.columns, headings):
+            self.tree.heading(col, text=text, anchor=tk.W, command=lambda c=col: self.sort(c))
+            self.tree.column(col, stretch=1, width=150)
+
+        # The grid is not stretched down because it only has rows for its height.
+        self.tree.grid(row=0, column=0, sticky=(tk.N, tk.E, tk.W))
+        self.ysb.grid(row=0, column=1, sticky=(tk.N, tk.S))
+        self.columnconfigure(0, weight=1)
+
+        self.tree.bind('<<TreeviewSelect>>', self.selected)
+        self.tree.bind('<MouseWheel>', lambda e: self.scroll(-3 if e.delta > 0 else 3))
+        self.tree.bind('<Button-4>', lambda e: self.scroll(-3))
+        self.tree.bind('<Button-5>', lambda e: self.scroll(3))
+        self.tree.bind('<Up>', lambda e: self.key_move(-1))
+        self.tree.bind('<Down>', lambda e: self.key_move(1))
+        self.tree.bind('<Prior>', lambda e: self.key_move(-rows))
+        self.tree.bind('<Next>', lambda e: self.key_move(rows))
+        self.refresh()
+
+    @debugger
+    def refresh(self):
+        '''
+        Read the rows from the start of the table again.
+        '''
+        self.window.refresh()
+        self.show()
+
+    def show(self):
+        '''
+        Put the rows of the window in the grid and set the scroll bar.
+        '''
+        self.tree.delete(*self.tree.get_children())
+        for row in self.window.rows:
+            values = ['' if row[col] is None else row[col] for col in self.columns]
+            self.tree.insert('', tk.END, iid=str(row['ID']), values=values)
+
+        count = self.window.count
+        if count > 0:
+            self.ysb.set(self.window.top / count, (self.window.top + len(self.window.rows)) / count)
+        else:
+            self.ysb.set(0.0, 1.0)
+
+        if not self.current is None and self.tree.exists(str(self.current)):
+            self.tree.selection_set(str(self.current))
+            self.tree.focus(str(self.current))
+
+    def scroll(self, amount):
+        if self.window.move_to(self.window.top + amount):
+            self.show()
+
+    def yview(self, *args):
+        '''
+        Called by the scroll bar with ('moveto', fraction) or ('scroll', number, what).
+        '''
+        if args[0] == 'moveto':
+            if self.window.move_to(int(float(args[1]) * self.window.count)):
+                self.show()
+        elif args[0] == 'scroll':
+            amount = int(args[1])
+            if args[2] == 'pages':
+                amount *= self.window.size
+            self.scroll(amount)
+
+    def key_move(self, amount):
+        '''
+        Move the selection with the keys. Past the top or bottom of the grid, the
+        grid is scrolled.
+        '''
+        items = self.tree.get_children()
+        if len(items) == 0:
+            return 'break'
+
+        focus = self.tree.focus()
+        if focus in items:
+            pos = items.index(focus) + amount
+        else:
+            pos = 0
+
+        if pos < 0 or pos >= len(items):
+            top = self.window.top
+            self.scroll(pos if pos < 0 else pos - len(items) + 1)
+            items = self.tree.get_children()
+            pos = max(0, min(pos - (self.window.top - top), len(items) - 1))
+
+        self.tree.selection_set(items[pos])
+        self.tree.focus(items[pos])
+        return 'break'
+
+    @debugger
+    def sort(self, col):
+        '''
+        Sort on a column. Clicking the same column again reverses the order.
+        '''
+        if col == self.window.order_col:
+            self.window.desc = not self.window.desc
+        else:
+            self.window.order_col = col
+            self.window.desc = False
+        self.refresh()
+
+    def selected(self, event=None):
+        sel = self.tree.selection()
+        if len(sel) > 0 and int(sel[0]) != self.current:
+            self.current = int(sel[0])
+            if not self.command is None:
+                self.command(self.current)
+
+class ProgressPanel(tk.Frame):
+    '''
+    Shows the progress of a job that runs in stages: the stage, a bar for the whole
+    job, the rows processed and the rows per second. The Cancel button calls the
+    command while the job is running.
+    '''
+
+    def __init__(self, owner, command=None, **kargs):
+        self.logger = get_logger(self)
+        self.logger.debug(sys._getframe().f_code.co_name)
+        super().__init__(owner, **kargs)
+
+        self.command = command
+        self.stage = tk.StringVar(self)
+        self.detail = tk.StringVar(self)
+
+        tk.Label(self, textvariable=self.stage, width=40, anchor=tk.W).grid(row=0, column=0, sticky=tk.W)
+        self.bar = ttk.Progressbar(self, orient=tk.HORIZONTAL, length=300, mode='determinate', maximum=1.0)
+        self.bar.grid(row=1, column=0, padx=5, pady=5)
+        self.btn = tk.Button(self, text='Cancel', command=self.cancel, width=8)
+        self.btn.grid(row=1, column=1, padx=5, pady=5)
+        tk.Label(self, textvariable=self.detail, width=40, anchor=tk.W).grid(row=2, column=0, sticky=tk.W)
+
+        self.finish('')
+
+    @debugger
+    def start(self, text):
+        self.stage.set(text)
+        self.detail.set('')
+        self.bar['value'] = 0.0
+        self.btn.configure(state='normal')
+
+    def update_progress(self, stage, index, count, rows, rate, fraction):
+        '''
+        Show the progress of stage number index of count stages.
+        '''
+        self.stage.set('%s (%d of %d)'%(stage, index+1, count))
+        self.detail.set('{:,} rows, {:,.0f} rows/s'.format(rows, rate))
+        self.bar['value'] = (index + min(fraction, 1.0)) / count
+
+    @debugger
+    def finish(self, text):
+        self.stage.set(text)
+        self.btn.configure(state='disabled')
+
+    @debugger
+    def cancel(self):
+        self.btn.configure(state='disabled')
+        self.stage.set('Cancelling...')
+        if not self.command is None:
+            self.command()
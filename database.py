@@ -1,10 +1,13 @@
-import os
+import os, re
 import time, locale
+import random
+from collections import OrderedDict, deque
+from contextlib import contextmanager
 
 import sqlite3 as sql
 import tkinter as tk
 from tkinter import messagebox as mbox
-from utility import Logger, debugger
+from utility import Logger, get_logger, debugger
 
 class Database(object):
     '''
@@ -23,21 +26,158 @@ class Database(object):
             Database()
         return Database.__instance
 
-    def __init__(self):
+    @staticmethod
+    def worker_instance():
+        '''
+        Return a new Database object with its own connection for a worker thread. A
+        SQLite connection can only be used by the thread that opened it, so this has
+        to be called in the worker thread, and the object is not the singleton.
+        '''
+        return Database(worker=True)
 
-        # gate the access to __init__()
-        if Database.__instance != None:
-            raise Exception("Database class is a singleton. Use get_instance() instead.")
-        else:
-            Database.__instance = self
+    def __init__(self, worker=False):
+
+        # gate the access to __init__(). Objects for worker threads are not the singleton.
+        if not worker:
+            if Database.__instance != None:
+                raise Exception("Database class is a singleton. Use get_instance() instead.")
+            else:
+                Database.__instance = self
 
         # Continue with init exactly once.
-        self.logger = Logger(self, Logger.DEBUG)
+        self.logger = get_logger(self)
         self.logger.debug("enter constructor")
-        self.data_version = '1.0'
         self.database_name = 'accounting.db'
         self.db_create_file = 'database.sql'
         self.db_pop_file = 'populate.sql'
+
+        # Bounded cache of the SQL templates that have been run. Values are always
+        # bound as parameters, so the text of a statement is its template and
+        # sqlite3 can reuse the compiled statement. This mirrors the connection's
+        # own statement cache and keeps the counters to show how well it works.
+        self.stmt_cache_size = 128
+        self.stmt_cache = OrderedDict()
+        self.stmt_hits = 0
+        self.stmt_misses = 0
+
+        # number of rows that the iter_* methods fetch from a cursor at a time
+        self.fetch_size = 500
+
+        # depth of the nested transaction() blocks that are open
+        self.tx_depth = 0
+
+        # Connection performance settings. The 'default' profile is applied when the
+        # database is opened. The 'safe' profile syncs every commit to disk and does
+        # not use memory mapped I/O. The 'bulk' profile is for large imports and uses a
+        # bigger cache. It keeps synchronous at NORMAL because OFF can corrupt the file
+        # if the OS crashes, and the import's checkpoint commits have to survive.
+        self.profiles = {
+            'default': {'journal_mode': 'WAL',
+                        'synchronous': 'NORMAL',
+                        'cache_size': -32000, # in KiB
+                        'mmap_size': 256*1024*1024,
+                        'temp_store': 'MEMORY'},
+            'safe': {'journal_mode': 'WAL',
+                     'synchronous': 'FULL',
+                     'cache_size': -32000,
+                     'mmap_size': 0,
+                     'temp_store': 'MEMORY'},
+            'bulk': {'journal_mode': 'WAL',
+                     'synchronous': 'NORMAL',
+                     'cache_size': -256000,
+                     'mmap_size': 1024*1024*1024,
+                     'temp_store': 'MEMORY'},
+        }
+        self.profile = 'default'
+
+        # Statement timing. The times are kept for each statement template. Statements
+        # that take longer than slow_query_time seconds are logged with their query plan.
+        # Setting slow_query_time to None turns off the slow query log.
+        self.query_stats = {}
+        self.query_samples = 1000 # max number of times kept per template for percentiles
+        self.slow_query_time = 0.25
+        self.slow_queries = deque(maxlen=100)
+        self.literal_re = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+        self.space_re = re.compile(r'\s+')
+
+        # Small lookup tables (mostly the static data from populate.sql) that are
+        # loaded once and then resolved in memory. The column values of other tables
+        # that are shown in combo boxes are cached the same way. A table's entries
+        # are dropped whenever a statement writes to that table.
+        self.ref_tables = ['Country', 'EmailStatus', 'PhoneStatus', 'ContactClass',
+                           'SaleStatus', 'PurchaseStatus', 'PurchaseType', 'VendorType',
+                           'AccountTypes']
+        self.ref_cache = {}
+        # Incremented when a table is written to, so that widgets that show the values
+        # of a table can tell when they need to read them again.
+        self.table_versions = {}
+        self.cache_generation = 0
+        self.write_re = re.compile(r'^\s*(?:INSERT|REPLACE|UPDATE|DELETE)\s+(?:OR\s+\w+\s+)?(?:INTO\s+|FROM\s+)?(\w+)', re.IGNORECASE)
+
+        # What the full text search index holds for each kind of record: the table, the
+        # SQL for the title and for the body, and the columns that they are made from.
+        # Column names are written as {p}name so that triggers can use new.name. The
+        # rowid in the index is the record ID times the number of kinds plus the position
+        # of the kind in this list, so a record's entry is found without a scan.
+        self.search_sources = [
+            ('Customer', "{p}name",
+                "coalesce({p}email_address,'') || ' ' || coalesce({p}description,'') || ' ' || coalesce({p}notes,'')",
+                ['name', 'email_address', 'description', 'notes']),
+            ('Vendor', "{p}name",
+                "coalesce({p}contact_name,'') || ' ' || coalesce({p}email_address,'') || ' ' || coalesce({p}description,'') || ' ' || coalesce({p}notes,'')",
+                ['name', 'contact_name', 'email_address', 'description', 'notes']),
+            ('SaleRecord', "{p}transaction_uuid", "coalesce({p}notes,'')", ['transaction_uuid', 'notes']),
+            ('PurchaseRecord', "{p}transaction_uuid", "coalesce({p}notes,'')", ['transaction_uuid', 'notes']),
+        ]
+        self.fts_index = False
+
+        # Schema changes that are applied to a database when it is opened. Each step
+        # brings the database up to the data_version it is tagged with. The number of
+        # steps that have been applied is kept in the database as PRAGMA user_version.
+        # A step can be a method that returns the statements when they depend on the
+        # SQLite library.
+        self.migrations = [
+            ('1.1', ['CREATE INDEX IF NOT EXISTS RawImport_TransactionID ON RawImport (TransactionID);',
+                     'CREATE INDEX IF NOT EXISTS RawImport_country ON RawImport (imported_country);',
+                     'CREATE INDEX IF NOT EXISTS RawImport_customer ON RawImport (imported_customer, BalanceImpact);',
+                     'CREATE INDEX IF NOT EXISTS RawImport_vendor ON RawImport (imported_vendor, BalanceImpact);',
+                     'CREATE INDEX IF NOT EXISTS RawImport_sale ON RawImport (imported_sale, imported_customer, BalanceImpact);',
+                     'CREATE INDEX IF NOT EXISTS RawImport_purchase ON RawImport (imported_purchase, imported_vendor, BalanceImpact);',
+                     'CREATE INDEX IF NOT EXISTS Customer_name ON Customer (name);',
+                     'CREATE INDEX IF NOT EXISTS Vendor_name ON Vendor (name);',
+                     'CREATE INDEX IF NOT EXISTS Country_abbreviation ON Country (abbreviation);',
+                     'CREATE INDEX IF NOT EXISTS ProductList_sale_record_ID ON ProductList (sale_record_ID);',
+                     'CREATE INDEX IF NOT EXISTS SaleRecord_transaction_uuid ON SaleRecord (transaction_uuid);',
+                     'CREATE INDEX IF NOT EXISTS PurchaseRecord_transaction_uuid ON PurchaseRecord (transaction_uuid);']),
+            # Case insensitive indexes for searching by the start of a name.
+            ('1.2', ['CREATE INDEX IF NOT EXISTS Customer_name_nocase ON Customer (name COLLATE NOCASE);',
+                     'CREATE INDEX IF NOT EXISTS Vendor_name_nocase ON Vendor (name COLLATE NOCASE);',
+                     'CREATE INDEX IF NOT EXISTS InventoryItem_name_nocase ON InventoryItem (name COLLATE NOCASE);',
+                     'CREATE INDEX IF NOT EXISTS Account_name_nocase ON Account (name COLLATE NOCASE);']),
+            ('1.3', self.search_index_statements),
+            # How much of each imported file has been read, so that a file is not imported
+            # twice and an import that was stopped can carry on where it left off.
+            ('1.4', self.file_state_statements),
+        ]
+
+        # the version of the schema that this code uses
+        self.data_version = self.migrations[-1][0]
+
+        # Queries made by the helpers that are expected to be satisfied by an index.
+        # These are checked with EXPLAIN QUERY PLAN when the schema is migrated.
+        self.indexed_queries = [
+            ('SELECT TransactionID FROM RawImport WHERE TransactionID = ?;', ('',)),
+            ('SELECT * FROM RawImport WHERE imported_country = false', ()),
+            ('SELECT * FROM RawImport WHERE imported_customer = false and BalanceImpact = ?', ('Credit',)),
+            ('SELECT * FROM RawImport WHERE imported_vendor = false and BalanceImpact = ?', ('Debit',)),
+            ('SELECT ID FROM Customer WHERE name = ?;', ('',)),
+            ('SELECT ID FROM Vendor WHERE name = ?;', ('',)),
+            ('SELECT abbreviation FROM Country WHERE abbreviation = ?;', ('',)),
+            ('SELECT * FROM ProductList WHERE sale_record_ID = ?;', (0,)),
+            ('SELECT ID FROM SaleRecord WHERE transaction_uuid = ?;', ('',)),
+            ("SELECT ID, name FROM Customer WHERE name LIKE ? ESCAPE '\\' ORDER BY name COLLATE NOCASE, ID LIMIT ?;", ('a%', 50)),
+        ]
+
         self.open()
         locale.setlocale(locale.LC_ALL, 'en_US.UTF-8')
         self.logger.debug("leave constructor")
@@ -49,8 +189,171 @@ class Database(object):
         if not os.path.isfile(self.database_name):
             self.create_database()
 
-        self.db = sql.connect(self.database_name)
+        self.db = sql.connect(self.database_name, cached_statements=self.stmt_cache_size)
         self.db.row_factory = sql.Row
+        self.db.create_function('to_amount', 1, self.to_amount, deterministic=True)
+        self.set_profile(self.profile)
+        if self.migrate() > 0:
+            self.check_query_plans()
+
+        # The migration does not make the search index when SQLite does not have FTS5.
+        # It is made here once the SQLite library has it.
+        self.fts_index = self.has_search_index()
+        if not self.fts_index and self.has_fts5():
+            self.logger.info("creating the search index")
+            for stmt in self.search_index_statements():
+                self.execute(stmt)
+            self.db.commit()
+            self.fts_index = self.has_search_index()
+
+    @debugger
+    def set_profile(self, name):
+        '''
+        Apply one of the performance profiles to the connection. Anything that has not
+        been committed is committed first because some of the settings cannot be
+        changed inside of a transaction. Returns the name of the previous profile.
+        '''
+        if self.tx_depth > 0:
+            raise Exception("The performance profile cannot be changed inside of a transaction.")
+
+        if self.db.in_transaction:
+            self.db.commit()
+
+        self.logger.debug("set profile: %s", name)
+        for pragma, value in self.profiles[name].items():
+            # PRAGMA does not accept parameters.
+            self.db.execute('PRAGMA %s = %s;'%(pragma, str(value)))
+
+        retv = self.profile
+        self.profile = name
+        return retv
+
+    @debugger
+    def set_progress_handler(self, func, steps=100000):
+        '''
+        Call func every so many steps of the SQLite virtual machine while a statement
+        runs. If it returns True, then the statement is stopped and raises an error. This
+        is how a long statement is cancelled. Use None to remove the handler.
+        '''
+        self.db.set_progress_handler(func, steps)
+
+    @contextmanager
+    def use_profile(self, name):
+        '''
+        Use a performance profile for the length of a "with" block and then go back to
+        the profile that was in use before.
+        '''
+        previous = self.set_profile(name)
+        try:
+            yield self
+        finally:
+            self.set_profile(previous)
+
+    @debugger
+    def migrate(self):
+        '''
+        Apply the schema migrations that the database has not seen yet and return the
+        number of steps that were applied. Each step and the new user_version are one
+        transaction, so a step that is stopped part way is run again from the start the
+        next time that the database is opened. A database that has had more steps than
+        this code knows about was written by a newer version and is left alone.
+        '''
+        applied = self.db.execute('PRAGMA user_version;').fetchone()[0]
+        if applied > len(self.migrations):
+            self.logger.warning("the database was written by a newer version of the program (schema step %d, this version knows %d)",
+                                applied, len(self.migrations))
+            return 0
+
+        count = 0
+        for idx in range(applied, len(self.migrations)):
+            version, statements = self.migrations[idx]
+            self.logger.info("migrating database to version %s"%(version))
+            with self.transaction():
+                if callable(statements):
+                    statements = statements()
+                for stmt in statements:
+                    self.execute(stmt)
+                # PRAGMA does not accept parameters.
+                self.execute('PRAGMA user_version = %d;'%(idx+1))
+            count += 1
+
+        return count
+
+    @debugger
+    def file_state_statements(self):
+        '''
+        Return the statements that add the columns to ImportedFileNames that keep how
+        much of each file has been read. ADD COLUMN cannot be run twice, so only the
+        columns that are missing are added. That also finishes a database that an older
+        version left part way through this step.
+        '''
+        cols = [row[1] for row in self.db.execute('PRAGMA table_info(ImportedFileNames);')]
+        retv = []
+        for col, decl in [('hash', 'TEXT'),
+                          ('size', 'INTEGER'),
+                          ('byte_offset', 'INTEGER DEFAULT 0'),
+                          ('line_count', 'INTEGER DEFAULT 0'),
+                          ('complete', 'BOOL DEFAULT false')]:
+            if not col in cols:
+                retv.append('ALTER TABLE ImportedFileNames ADD COLUMN %s %s;'%(col, decl))
+        retv.append('CREATE INDEX IF NOT EXISTS ImportedFileNames_hash ON ImportedFileNames (hash);')
+        return retv
+
+    def has_fts5(self):
+        options = [row[0] for row in self.db.execute('PRAGMA compile_options;')]
+        return 'ENABLE_FTS5' in options
+
+    def has_search_index(self):
+        return self.db.execute("SELECT count(*) FROM sqlite_master WHERE type='table' AND name='SearchIndex';").fetchone()[0] > 0
+
+    @debugger
+    def search_index_statements(self):
+        '''
+        Return the statements that create the full text search index, the triggers that
+        keep it up to date and fill it with the records that already exist. If SQLite
+        does not have FTS5, then there are none and search() uses LIKE instead.
+        '''
+        if not self.has_fts5():
+            self.logger.warning("SQLite does not have FTS5, the search index is not created")
+            return []
+
+        # remove_diacritics 2 needs SQLite 3.27. Before that only 1 is accepted.
+        if sql.sqlite_version_info >= (3, 27, 0):
+            diacritics = 2
+        else:
+            diacritics = 1
+
+        n = len(self.search_sources)
+        retv = ["CREATE VIRTUAL TABLE IF NOT EXISTS SearchIndex USING fts5(kind UNINDEXED, ref_ID UNINDEXED, title, body, tokenize='unicode61 remove_diacritics %d');"%(diacritics)]
+        for code, (table, title, body, cols) in enumerate(self.search_sources):
+            insert = "INSERT INTO SearchIndex (rowid, kind, ref_ID, title, body) VALUES (new.ID*%d+%d, '%s', new.ID, %s, %s);"%(
+                        n, code, table, title.format(p='new.'), body.format(p='new.'))
+            delete = 'DELETE FROM SearchIndex WHERE rowid = old.ID*%d+%d;'%(n, code)
+            retv.append('CREATE TRIGGER IF NOT EXISTS %s_search_insert AFTER INSERT ON %s BEGIN %s END;'%(table, table, insert))
+            retv.append('CREATE TRIGGER IF NOT EXISTS %s_search_update AFTER UPDATE OF %s ON %s BEGIN %s %s END;'%(
+                        table, ','.join(cols), table, delete, insert))
+            retv.append('CREATE TRIGGER IF NOT EXISTS %s_search_delete AFTER DELETE ON %s BEGIN %s END;'%(table, table, delete))
+            retv.append("INSERT INTO SearchIndex (rowid, kind, ref_ID, title, body) SELECT ID*%d+%d, '%s', ID, %s, %s FROM %s;"%(
+                        n, code, table, title.format(p=''), body.format(p=''), table))
+
+        return retv
+
+    @debugger
+    def check_query_plans(self):
+        '''
+        Run EXPLAIN QUERY PLAN on the helper queries that should use an index and
+        warn about any that scan the table instead. Returns a list of the queries
+        that do not use an index.
+        '''
+        retv = []
+        for stmt, params in self.indexed_queries:
+            plan = self.db.execute('EXPLAIN QUERY PLAN %s'%(stmt), params).fetchall()
+            detail = ' '.join([row[3] for row in plan])
+            if not 'USING' in detail:
+                self.logger.warning('query does not use an index: %s (%s)'%(stmt, detail))
+                retv.append(stmt)
+
+        return retv
 
     @debugger
     def close(self):
@@ -131,38 +434,328 @@ class Database(object):
         return retv
 
     @debugger
-    def execute(self, sql):
+    def execute(self, sql, params=()):
         '''
-        Execute an arbitrary SQL statement.
+        Execute an arbitrary SQL statement. Values should be passed in params and
+        referenced with '?' in the statement so the statement can be reused.
         '''
-        self.logger.debug("SQL=%s" % (sql))
-        return self.db.execute(sql)
+        self.logger.debug("SQL=%s (%s)", sql, params)
+        self.cache_statement(sql)
+        self.check_write(sql)
+        start = time.perf_counter()
+        retv = self.db.execute(sql, params)
+        self.time_statement(sql, params, time.perf_counter()-start)
+        return retv
+
+    @debugger
+    def check_write(self, sql):
+        '''
+        If the statement writes to a table, then drop any cached reference data
+        for that table.
+        '''
+        match = self.write_re.match(sql)
+        if not match is None:
+            self.invalidate(match.group(1))
+
+    @debugger
+    def execute_many(self, sql, seq):
+        '''
+        Execute a SQL statement once for every set of parameters in seq.
+        '''
+        self.logger.debug("SQL=%s (many)", sql)
+        self.cache_statement(sql)
+        self.check_write(sql)
+        start = time.perf_counter()
+        retv = self.db.executemany(sql, seq)
+        self.time_statement(sql, None, time.perf_counter()-start)
+        return retv
+
+    def time_statement(self, stmt, params, elapsed):
+        '''
+        Add the time that a statement took to the statistics for its template. The time
+        of a SELECT only covers finding the first row. This is called for every
+        statement, so it is not wrapped with the debugger.
+        '''
+        stats = self.query_stats.get(stmt)
+        if stats is None:
+            stats = {'count': 0, 'total': 0.0, 'max': 0.0, 'samples': []}
+            self.query_stats[stmt] = stats
+
+        stats['count'] += 1
+        stats['total'] += elapsed
+        if elapsed > stats['max']:
+            stats['max'] = elapsed
+        # keep a random sample of the times once there are too many to keep them all
+        if len(stats['samples']) < self.query_samples:
+            stats['samples'].append(elapsed)
+        else:
+            idx = random.randrange(stats['count'])
+            if idx < self.query_samples:
+                stats['samples'][idx] = elapsed
+
+        if not self.slow_query_time is None and elapsed > self.slow_query_time:
+            self.log_slow_query(stmt, params, elapsed)
+
+    @debugger
+    def log_slow_query(self, stmt, params, elapsed):
+        '''
+        Save a slow statement with its query plan and write it to the log. The plan is
+        not available for statements that were run with execute_many().
+        '''
+        plan = None
+        if not params is None:
+            try:
+                rows = self.db.execute('EXPLAIN QUERY PLAN %s'%(stmt), params).fetchall()
+                plan = ' '.join([row[3] for row in rows])
+            except sql.Error:
+                pass
+
+        stmt = self.normalize_statement(stmt)
+        self.slow_queries.append({'sql': stmt, 'time': elapsed, 'plan': plan})
+        self.logger.warning('slow query (%0.3f sec): %s PLAN: %s'%(elapsed, stmt, plan))
+
+    @debugger
+    def normalize_statement(self, sql):
+        '''
+        Return the template of a statement with any literal strings and numbers
+        replaced with '?' and the white space collapsed.
+        '''
+        return self.space_re.sub(' ', self.literal_re.sub('?', sql)).strip()
+
+    @debugger
+    def get_query_stats(self):
+        '''
+        Return a list of dicts with the timing of each statement template, sorted by
+        the total time spent in it. Times are in seconds.
+        '''
+        merged = {}
+        for stmt, stats in self.query_stats.items():
+            key = self.normalize_statement(stmt)
+            if not key in merged:
+                merged[key] = {'sql': key, 'count': 0, 'total': 0.0, 'max': 0.0, 'samples': []}
+            entry = merged[key]
+            entry['count'] += stats['count']
+            entry['total'] += stats['total']
+            entry['max'] = max(entry['max'], stats['max'])
+            entry['samples'] += stats['samples']
+
+        retv = []
+        for entry in merged.values():
+            samples = sorted(entry.pop('samples'))
+            entry['p50'] = samples[int(len(samples)*0.50)]
+            entry['p95'] = samples[min(int(len(samples)*0.95), len(samples)-1)]
+            retv.append(entry)
+
+        retv.sort(key=lambda x: x['total'], reverse=True)
+        return retv
+
+    @debugger
+    def dump_query_stats(self, limit=20):
+        '''
+        Write a summary of the statement timing to the log.
+        '''
+        self.logger.msg('query timing (msec): count total p50 p95 max statement')
+        for entry in self.get_query_stats()[:limit]:
+            self.logger.msg('%6d %10.3f %8.3f %8.3f %8.3f %s'%(entry['count'],
+                            entry['total']*1000, entry['p50']*1000, entry['p95']*1000,
+                            entry['max']*1000, entry['sql']))
+        for entry in self.slow_queries:
+            self.logger.msg('slow query (%0.3f sec): %s PLAN: %s'%(entry['time'], entry['sql'], entry['plan']))
+
+    @debugger
+    def cache_statement(self, sql):
+        '''
+        Record a statement template in the statement cache and update the hit
+        and miss counters. The least recently used template is dropped when the
+        cache is full, the same as the connection does.
+        '''
+        if sql in self.stmt_cache:
+            self.stmt_cache.move_to_end(sql)
+            self.stmt_cache[sql] += 1
+            self.stmt_hits += 1
+        else:
+            self.stmt_cache[sql] = 1
+            self.stmt_misses += 1
+            if len(self.stmt_cache) > self.stmt_cache_size:
+                self.stmt_cache.popitem(last=False)
+
+    @debugger
+    def get_cache_stats(self):
+        '''
+        Return a dict with the statement cache counters.
+        '''
+        return {'hits': self.stmt_hits,
+                'misses': self.stmt_misses,
+                'size': len(self.stmt_cache),
+                'capacity': self.stmt_cache_size}
 
     @debugger
     def commit(self):
         '''
-        Commit the database to disk.
+        Commit the database to disk. Inside of a transaction() block this does
+        nothing and the commit happens when the outer block exits.
         '''
+        if self.tx_depth > 0:
+            self.logger.debug("commit deferred to the end of the transaction")
+            return
         self.db.commit()
 
+    @contextmanager
+    def transaction(self):
+        '''
+        Group the writes made inside of a "with" block so they are committed together.
+        The outer block commits when it exits and rolls everything back if an exception
+        escapes from it. Nested blocks use a savepoint, so an exception in a nested
+        block only rolls back what was written in that block.
+
+        After some errors (an interrupted statement, a full disk, out of memory) SQLite
+        has already rolled back the whole transaction, and the savepoint is gone. The
+        exception that ended the block is always the one that is raised.
+        '''
+        name = 'tx%d'%(self.tx_depth)
+        if self.tx_depth == 0:
+            if not self.db.in_transaction:
+                self.db.execute('BEGIN;')
+        else:
+            self.db.execute('SAVEPOINT %s;'%(name))
+
+        self.tx_depth += 1
+        try:
+            yield self
+        except:
+            self.tx_depth -= 1
+            try:
+                if self.tx_depth == 0:
+                    self.db.rollback()
+                elif self.db.in_transaction:
+                    self.db.execute('ROLLBACK TO %s;'%(name))
+                    self.db.execute('RELEASE %s;'%(name))
+            except sql.Error as e:
+                self.logger.error("cannot roll back the transaction: %s", str(e))
+            # cached data may have been read from the rows that were rolled back
+            self.invalidate_all()
+            raise
+        else:
+            self.tx_depth -= 1
+            if self.tx_depth == 0:
+                self.db.commit()
+            else:
+                self.db.execute('RELEASE %s;'%(name))
+
+    @debugger
+    def load_ref_table(self, table, col):
+        '''
+        Read a lookup table into the reference cache. The entry is a tuple of a dict
+        that maps the column value to the ID and a list of the values in ID order.
+        When a value appears more than once, the first ID is kept, the same as
+        get_id_by_row() does.
+        '''
+        ids = {}
+        names = []
+        curs = self.execute('SELECT ID, %s FROM %s ORDER BY ID;'%(col, table))
+        for row in curs:
+            ids.setdefault(row[1], row[0])
+            names.append(row[1])
+
+        self.ref_cache[(table, col)] = (ids, names)
+        return self.ref_cache[(table, col)]
+
+    @debugger
+    def get_ref_id(self, table, col, val):
+        '''
+        Return the ID of the row in a lookup table where the column matches the value.
+        Tables that are not reference tables are looked up in the database.
+        '''
+        if not table in self.ref_tables:
+            return self.get_id_by_row(table, col, val)
+
+        entry = self.ref_cache.get((table, col))
+        if entry is None:
+            entry = self.load_ref_table(table, col)
+        return entry[0].get(val)
+
+    @debugger
+    def get_ref_names(self, table, col='name'):
+        '''
+        Return the list of values in a table column, in ID order. This is what the combo
+        boxes show. The values of any table are cached until the table is written to.
+        '''
+        entry = self.ref_cache.get((table, col))
+        if entry is None:
+            entry = self.load_ref_table(table, col)
+        return list(entry[1])
+
+    @debugger
+    def invalidate(self, table):
+        '''
+        Drop the cached reference data for a table.
+        '''
+        self.table_versions[table] = self.table_versions.get(table, 0) + 1
+        for key in list(self.ref_cache):
+            if key[0] == table:
+                del self.ref_cache[key]
+
+    @debugger
+    def invalidate_all(self):
+        '''
+        Drop all of the cached reference data.
+        '''
+        self.cache_generation += 1
+        self.ref_cache.clear()
+
+    @debugger
+    def get_table_version(self, table):
+        '''
+        Return a value that changes every time that the table is written to.
+        '''
+        return (self.cache_generation, self.table_versions.get(table, 0))
+
+    @debugger
+    def rollback(self):
+        '''
+        Throw away everything that was written since the last commit.
+        '''
+        self.db.rollback()
+        self.invalidate_all()
+
     @debugger
     def populate_list(self, table, column):
         '''
         Return a list with all of the items then the column of the table.
         '''
-        curs = self.execute('select %s from %s;'%(column, table))
         retv = []
-        for item in curs:
+        for item in self.iter_column(table, column):
             retv.append(' '.join(item))
             #retv.append(item)
         return retv
 
+    @debugger
+    def get_count(self, table, where=None, params=()):
+        '''
+        Return the number of rows in the table that match the where clause.
+        '''
+        if where is None:
+            sql = 'SELECT COUNT(*) FROM %s;'%(table)
+        else:
+            sql = 'SELECT COUNT(*) FROM %s WHERE %s;'%(table, where)
+        return self.execute(sql, params).fetchone()[0]
+
+    @debugger
+    def get_single_row(self, sql, params=()):
+        '''
+        Run a SELECT and return the first row as a dict, or None if there are no rows.
+        '''
+        row = self.execute(sql, params).fetchone()
+        if row is None:
+            return None
+        return dict(row)
+
     @debugger
     def get_row_by_id(self, table, ID):
         '''
         Return a dict of all of the columns in the row that has the specified ID.
         '''
-        curs = self.execute('select * from %s where ID = %d;'%(table, ID)).fetchall()
+        curs = self.execute('SELECT * FROM %s WHERE ID = ?;'%(table), (ID,)).fetchall()
         try:
             retv = dict(curs[0])
             return retv
@@ -174,11 +767,8 @@ class Database(object):
         '''
         Return a dictionary of the columns in the row where a data element matches the value given.
         '''
-        if type(val) is str:
-            sql = 'SELECT ID FROM %s WHERE %s = \"%s\";'%(table, col, val)
-        else:
-            sql = 'SELECT ID FROM %s WHERE %s = %s;'%(table, col, val)
-        row = self.execute(sql).fetchall()
+        sql = 'SELECT ID FROM %s WHERE %s = ?;'%(table, col)
+        row = self.execute(sql, (val,)).fetchall()
 
         if len(row) == 0:
             return None
@@ -193,31 +783,182 @@ class Database(object):
         return self.db.cursor()
 
     @debugger
-    def get_id_list(self, table, where=None):
+    def iter_cursor(self, curs, batch_size=None):
         '''
-        Get a list of all of the IDs in the table
+        Generator that yields the rows of a cursor. The rows are fetched batch_size
+        at a time so that only one batch is held in memory.
+        '''
+        if batch_size is None:
+            batch_size = self.fetch_size
+
+        while True:
+            rows = curs.fetchmany(batch_size)
+            if len(rows) == 0:
+                break
+            for row in rows:
+                yield row
+
+    @debugger
+    def iter_column(self, table, column, batch_size=None):
+        '''
+        Generator that yields the rows of a single column of a table.
+        '''
+        curs = self.execute('SELECT %s FROM %s;'%(column, table))
+        return self.iter_cursor(curs, batch_size)
+
+    @debugger
+    def iter_ids(self, table, where=None, params=(), batch_size=None):
+        '''
+        Generator that yields the IDs in the table. Values used in the where clause
+        should be given as '?' and passed in params.
         '''
-        retv = []
         if where is None:
             sql = 'SELECT ID FROM %s;'%(table)
         else:
             sql = 'SELECT ID FROM %s WHERE %s;'%(table, where)
-        cur = self.execute(sql)
-        for item in cur:
-            retv.append(item[0])
+        curs = self.execute(sql, params)
+        for item in self.iter_cursor(curs, batch_size):
+            yield item[0]
 
-        return retv
+    @debugger
+    def iter_rows(self, table, where=None, params=(), batch_size=None):
+        '''
+        Generator that yields the rows that match the where clause as dicts. Values
+        used in the where clause should be given as '?' and passed in params.
+        '''
+        if where is None:
+            sql = 'SELECT * FROM %s;'%(table)
+        else:
+            sql = 'SELECT * FROM %s WHERE %s;'%(table, where)
+        curs = self.execute(sql, params)
+        for item in self.iter_cursor(curs, batch_size):
+            yield dict(item)
+
+    @debugger
+    def iter_rows_by_col(self, table, col, val, batch_size=None):
+        '''
+        Generator that yields the rows where the column has a certain value as dicts.
+        '''
+        return self.iter_rows(table, '%s = ?'%(col), (val,), batch_size)
+
+    @debugger
+    def get_page(self, table, columns, order_col='ID', after=None, limit=100, desc=False, offset=0):
+        '''
+        Get one page of rows for browsing a table, sorted by order_col and then by ID.
+        The rows have the ID followed by the columns. The page starts after the key
+        (order_col value, ID) given in after, which is taken from the last row of the
+        previous page. Use None for the first page.
+
+        This does not use OFFSET, so reading a page deep in a large table does not read
+        all of the rows before it. NULLs sort first, or last when desc is True. The offset
+        skips that many rows first. It is only for jumping to a position, because the rows
+        that are skipped are still read.
+        '''
+        cols = ','.join(['ID'] + [x for x in columns if x != 'ID'])
+        if order_col == 'ID':
+            order = 'ID DESC' if desc else 'ID'
+        else:
+            order = '%s DESC, ID DESC'%(order_col) if desc else '%s, ID'%(order_col)
+
+        if after is None:
+            where = ''
+            params = ()
+        elif order_col == 'ID':
+            where = 'WHERE ID %s ?'%('<' if desc else '>')
+            params = (after[1],)
+        elif after[0] is None:
+            if desc:
+                where = 'WHERE %s IS NULL AND ID < ?'%(order_col)
+            else:
+                where = 'WHERE (%s IS NULL AND ID > ?) OR %s IS NOT NULL'%(order_col, order_col)
+            params = (after[1],)
+        else:
+            if desc:
+                where = 'WHERE (%s, ID) < (?, ?) OR %s IS NULL'%(order_col, order_col)
+            else:
+                where = 'WHERE (%s, ID) > (?, ?)'%(order_col)
+            params = tuple(after)
+
+        if offset > 0:
+            sql = 'SELECT %s FROM %s %s ORDER BY %s LIMIT ? OFFSET ?;'%(cols, table, where, order)
+            params += (limit, offset)
+        else:
+            sql = 'SELECT %s FROM %s %s ORDER BY %s LIMIT ?;'%(cols, table, where, order)
+            params += (limit,)
+        return self.execute(sql, params).fetchall()
+
+    def like_escape(self, text):
+        '''
+        Escape the wildcards in text for a LIKE pattern that uses ESCAPE '\\'.
+        '''
+        return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
 
     @debugger
-    def get_row_list(self, table, where):
+    def search(self, text, limit=50):
         '''
-        Get a generic list of rows based on more than one criteria
+        Search the customers, vendors, sales and purchases for the words in the text and
+        return up to limit hits, best first. Each hit is a dict with the kind of record
+        (its table), the ID, the title, a snippet of the text that matched and the rank.
+        A word matches the start of a word, so "ston" finds "Stone". If the database has
+        no full text index, then the records are searched with LIKE and are not ranked.
         '''
+        words = text.split()
+        if len(words) == 0:
+            return []
+
+        if self.fts_index:
+            query = ' '.join(['"%s"*'%(word.replace('"', '""')) for word in words])
+            sql = '''SELECT kind, ref_ID, title, snippet(SearchIndex, 3, '[', ']', '...', 12) AS snippet,
+                        bm25(SearchIndex, 0.0, 0.0, 10.0, 1.0) AS rank
+                     FROM SearchIndex WHERE SearchIndex MATCH ? ORDER BY rank LIMIT ?;'''
+            params = (query,)
+        else:
+            parts = []
+            params = ()
+            for table, title, body, cols in self.search_sources:
+                expr = "(%s || ' ' || %s)"%(title.format(p=''), body.format(p=''))
+                where = ' AND '.join(["%s LIKE ? ESCAPE '\\'"%(expr)] * len(words))
+                parts.append("SELECT '%s' AS kind, ID AS ref_ID, %s AS title, %s AS snippet, 0.0 AS rank FROM %s WHERE %s"%(
+                                table, title.format(p=''), body.format(p=''), table, where))
+                params += tuple(['%' + self.like_escape(word) + '%' for word in words])
+            sql = ' UNION ALL '.join(parts) + ' LIMIT ?;'
+
         retv = []
-        sql = 'SELECT * FROM %s WHERE %s'%(table, where)
-        cur = self.execute(sql)
-        for item in cur:
-            retv.append(dict(item))
+        for row in self.execute(sql, params + (limit,)):
+            retv.append({'kind': row['kind'],
+                         'ID': row['ref_ID'],
+                         'title': row['title'],
+                         'snippet': row['snippet'],
+                         'rank': row['rank']})
+        return retv
+
+    @debugger
+    def search_prefix(self, table, column, prefix, limit=50):
+        '''
+        Return up to limit rows of (ID, column) where the column starts with the prefix,
+        ignoring case, in order of the column. This uses the NOCASE index on the column
+        if there is one, so only the rows that are returned are read.
+        '''
+        pattern = self.like_escape(prefix) + '%'
+        sql = "SELECT ID, %s FROM %s WHERE %s LIKE ? ESCAPE '\\' ORDER BY %s COLLATE NOCASE, ID LIMIT ?;"%(
+                    column, table, column, column)
+        return self.execute(sql, (pattern, limit)).fetchall()
+
+    @debugger
+    def get_id_list(self, table, where=None, params=()):
+        '''
+        Get a list of all of the IDs in the table. Values used in the where clause
+        should be given as '?' and passed in params.
+        '''
+        return list(self.iter_ids(table, where, params))
+
+    @debugger
+    def get_row_list(self, table, where, params=()):
+        '''
+        Get a generic list of rows based on more than one criteria. Values used in
+        the where clause should be given as '?' and passed in params.
+        '''
+        retv = list(self.iter_rows(table, where, params))
 
         if len(retv) == 0:
             return None
@@ -229,16 +970,7 @@ class Database(object):
         '''
         Get the list of all rows where the column has a certain value
         '''
-        retv = []
-        if type(val) is str:
-            sql = 'SELECT * FROM %s WHERE %s = \"%s\";'%(table, col, val)
-        else:
-            sql = 'SELECT * FROM %s WHERE %s = %s;'%(table, col, val)
-
-        self.logger.debug("SQL=%s" % (sql))
-        cur = self.execute(sql)
-        for item in cur:
-            retv.append(dict(item))
+        retv = list(self.iter_rows_by_col(table, col, val))
 
         if len(retv) == 0:
             return None
@@ -251,12 +983,8 @@ class Database(object):
         Return the ID where the data in the column matches the value. Only returns the
         first match.
         '''
-        if type(val) is str:
-            sql = 'select ID from %s where %s = \"%s\";'%(table, col, val)
-        else:
-            sql = 'select ID from %s where %s = %s;'%(table, col, str(val))
-
-        curs = self.execute(sql)
+        sql = 'SELECT ID FROM %s WHERE %s = ?;'%(table, col)
+        curs = self.execute(sql, (val,))
         recs = curs.fetchall()
 
         retv = None
@@ -271,9 +999,8 @@ class Database(object):
         '''
         Retrieve a single value where the table, column and row ID are known.
         '''
-        sql = 'SELECT %s FROM %s WHERE ID=%d;'%(col, table, row_id)
-        self.logger.debug("SQL=%s" % (sql))
-        curs = self.execute(sql)
+        sql = 'SELECT %s FROM %s WHERE ID = ?;'%(col, table)
+        curs = self.execute(sql, (row_id,))
         recs = curs.fetchall()
 
         retv = None
@@ -288,11 +1015,8 @@ class Database(object):
         '''
         Retrieve a single value where the table, column and row ID are known.
         '''
-        vals = tuple([val])
-        sql = 'UPDATE %s SET %s=? WHERE ID=%d;'%(table, col, row_id)
-        self.logger.debug("SQL=%s (%s)" % (sql, vals))
-
-        return self.db.execute(sql, vals)
+        sql = 'UPDATE %s SET %s = ? WHERE ID = ?;'%(table, col)
+        return self.execute(sql, (val, row_id))
 
     @debugger
     def insert_row(self, table, rec):
@@ -305,23 +1029,35 @@ class Database(object):
         vals = tuple(rec.values())
 
         sql = 'INSERT INTO %s (%s) VALUES (%s);'%(table, keys, qmks)
-        self.logger.debug("SQL=%s (%s)" % (sql, vals))
-        return self.db.execute(sql, vals).lastrowid
+        return self.execute(sql, vals).lastrowid
+
+    @debugger
+    def insert_rows(self, table, columns, rows):
+        '''
+        Insert many rows at once. The columns is a list of column names and rows is
+        an iterable of tuples with the values in the same order as the columns.
+        Returns the number of rows inserted.
+        '''
+        keys = ','.join(columns)
+        qmks = ','.join(list('?'*len(columns)))
+
+        sql = 'INSERT INTO %s (%s) VALUES (%s);'%(table, keys, qmks)
+        return self.execute_many(sql, rows).rowcount
 
     @debugger
-    def update_row(self, table, rec, where):
+    def update_row(self, table, rec, where, params=()):
         '''
         Update a row from a dictionary. This expects a dictionary where the keys are the column names and
-        the data is the value to place in those columns. A condition must be specified, such as ID=123.
-        Otherwise the database will have incorrect data placed in it.
+        the data is the value to place in those columns. A condition must be specified, such as ID=?, with
+        the values for the condition passed in params. Otherwise the database will have incorrect data
+        placed in it.
         '''
         keys = '=?,'.join(rec.keys())
         keys += '=?'
-        vals = tuple(rec.values())
+        vals = tuple(rec.values()) + tuple(params)
 
         sql = 'UPDATE %s SET %s WHERE %s;'%(table, keys, where)
-        self.logger.debug("SQL=%s (%s)" % (sql, vals))
-        return self.db.execute(sql, vals)
+        return self.execute(sql, vals)
 
     @debugger
     def update_row_by_id(self, table, rec, id):
@@ -331,40 +1067,35 @@ class Database(object):
         '''
         keys = '=?,'.join(rec.keys())
         keys += '=?'
-        vals = tuple(rec.values())
+        vals = tuple(rec.values()) + (id,)
 
-        sql = 'UPDATE %s SET %s WHERE ID = %d;'%(table, keys, id)
-        self.logger.debug("SQL=%s (%s)" % (sql, vals))
-        return self.db.execute(sql, vals)
+        sql = 'UPDATE %s SET %s WHERE ID = ?;'%(table, keys)
+        return self.execute(sql, vals)
 
     @debugger
     def delete_row(self, table, id):
         '''
         Delete the row given by the ID
         '''
-        sql = 'DELETE FROM %s WHERE ID = %d;' % (table, id)
-        self.logger.debug("SQL=%s" % (sql))
-        return self.db.execute(sql)
+        sql = 'DELETE FROM %s WHERE ID = ?;' % (table)
+        return self.execute(sql, (id,))
 
     @debugger
-    def delete_where(self, table, where):
+    def delete_where(self, table, where, params=()):
         '''
-        Delete rows that conform to the "where" clause.
+        Delete rows that conform to the "where" clause. Values used in the where
+        clause should be given as '?' and passed in params.
         '''
         sql = 'DELETE FROM %s WHERE %s;' % (table, where)
-        self.logger.debug("SQL=%s" % (sql))
-        return self.db.execute(sql)
+        return self.execute(sql, params)
 
     @debugger
     def if_rec_exists(self, table, column, value):
         '''
         Return True if there is a row that has the column with the value
         '''
-        if type(value) is int or type(value) is float:
-            sql = 'SELECT %s FROM %s WHERE %s = %s;'%(column, table, column, str(value))
-        else:
-            sql = 'SELECT %s FROM %s WHERE %s = \"%s\";'%(column, table, column, value)
-        cursor = self.db.execute(sql)
+        sql = 'SELECT %s FROM %s WHERE %s = ?;'%(column, table, column)
+        cursor = self.execute(sql, (value,))
         if cursor.fetchone() is None:
             return False
 
@@ -376,7 +1107,7 @@ class Database(object):
         Convert the value to the specified type. The value_type is an actual python type name.
         '''
         retv = None
-        self.logger.debug('val type: %s, value: %s, target type: %s'%(type(val), val, value_type))
+        self.logger.debug('val type: %s, value: %s, target type: %s', type(val), val, value_type)
         #try:
         if type(val) is value_type:
             retv = val
@@ -407,5 +1138,17 @@ class Database(object):
         #     self.logger.error('Cannot convert value')
         #     exit(1)
 
-        self.logger.debug('made it here: %s'%(str(retv)))
+        self.logger.debug('made it here: %s', retv)
         return retv
+
+    def to_amount(self, val):
+        '''
+        Convert a currency string from the import file to an absolute float. This
+        is registered as the SQL function to_amount() and is called once for every
+        row, so it is not wrapped with the debugger.
+        '''
+        if val is None:
+            return None
+        if val == '':
+            return 0.0
+        return abs(locale.atof(val))
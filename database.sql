@@ -1,6 +1,10 @@
 ###############################################################################
 # This file is intended to be imported by the accounting program
 # in the event that no database is found.
+#
+# Indexes are not created here. They are added by the schema migrations in
+# database.py, which are applied to new and existing databases when they are
+# opened.
 
 ###############################################################################
 ### Information Database Structure
@@ -3,7 +3,7 @@ from tkinter import ttk
 import tkinter as tk
 from tkinter.messagebox import showerror
 import math
-from utility import Logger, debugger
+from utility import Logger, get_logger, debugger
 from database import Database
 
 
@@ -16,7 +16,7 @@ class BaseDialog(tk.Toplevel):
     def __init__(self, parent):# , title = None):
 
         #init the logger
-        self.logger = Logger(self, level=Logger.DEBUG)
+        self.logger = get_logger(self)
         self.logger.debug("Base Dialog start constructor")
 
         tk.Toplevel.__init__(self, parent)
@@ -96,13 +96,16 @@ class BaseDialog(tk.Toplevel):
 
 class SelectItem(BaseDialog):
     '''
-    Create a list of items called 'name' from a table and return the database
-    ID of the item in item_id.
+    Select an item from a table by its name and return the database ID of the
+    item in item_id, or -1 if nothing was selected. The list shows the items
+    whose name starts with what has been typed. It is read again from the
+    database after typing stops for a moment, and only the first matches are
+    read.
     '''
 
     def __init__(self, master, table, column, thing=None):
 
-        self.logger = Logger(self, level=Logger.DEBUG)
+        self.logger = get_logger(self)
         self.logger.debug('SelectItem enter constructor')
         self.table = table
         self.column = column
@@ -112,6 +115,10 @@ class SelectItem(BaseDialog):
             self.thing = thing
 
         self.item_id = -1
+        self.ids = []
+        self.limit = 50 # most items shown at a time
+        self.delay = 250 # ms to wait after a key before searching
+        self.pending = None
         super().__init__(master)
         self.wait_window(self)
         self.logger.debug('SelectItem leave constructor')
@@ -128,39 +135,96 @@ class SelectItem(BaseDialog):
         frame.grid(row=0, column=0, padx=4, pady=7)
         tk.Label(frame, text="Select %s"%(self.thing), font=("Helvetica", 14)).grid(row=0, column=0, columnspan=2)
 
-        ######################
-        # Populate the combo boxes
-        lst = self.data.populate_list(self.table, self.column)
-        lst.sort()
-
         ######################
         # Show the boxes
         tk.Label(frame, text='Name:').grid(row=1, column=0)
-        self.cbb = ttk.Combobox(frame, values=lst)
-        self.cbb.grid(row=1, column=1, padx=padx, pady=pady)
-        try:
-            self.cbb.current(0)
-        except tk.TclError:
-            mb.showerror("TCL ERROR", "No records are available to select for this table.")
+        self.text = tk.StringVar(frame)
+        entry = tk.Entry(frame, textvariable=self.text, width=40)
+        entry.grid(row=1, column=1, padx=padx, pady=pady, sticky=tk.W)
+
+        lframe = tk.Frame(frame)
+        lframe.grid(row=2, column=1, padx=padx, pady=pady)
+        self.lbox = tk.Listbox(lframe, width=40, height=15, exportselection=False)
+        sb = tk.Scrollbar(lframe, orient=tk.VERTICAL, command=self.lbox.yview)
+        self.lbox.config(yscrollcommand=sb.set)
+        self.lbox.pack(side=tk.LEFT)
+        sb.pack(side=tk.RIGHT, fill=tk.Y)
+
+        self.status = tk.StringVar(frame)
+        tk.Label(frame, textvariable=self.status).grid(row=3, column=1, sticky=tk.W)
+
+        self.text.trace_add('write', self.changed)
+        self.lbox.bind('<Double-1>', self.ok)
+        entry.bind('<Return>', self.ok)
+        entry.bind('<Down>', lambda e: self.lbox.focus_set())
+
+        self.search()
+        return entry
+
+    def changed(self, *args):
+        '''
+        Called for every change to the text. The search is put off until there have
+        been no changes for a moment.
+        '''
+        if not self.pending is None:
+            self.after_cancel(self.pending)
+        self.pending = self.after(self.delay, self.search)
+
+    @debugger
+    def search(self):
+        '''
+        Fill the list with the items that start with the text.
+        '''
+        self.pending = None
+        rows = self.data.search_prefix(self.table, self.column, self.text.get(), self.limit)
+
+        # Items with the same name are told apart by their ID.
+        names = [row[1] for row in rows]
+        self.ids = [row[0] for row in rows]
+        self.lbox.delete(0, tk.END)
+        for id, name in zip(self.ids, names):
+            if names.count(name) > 1:
+                self.lbox.insert(tk.END, '%s (%d)'%(name, id))
+            else:
+                self.lbox.insert(tk.END, name)
+
+        if len(rows) > 0:
+            self.lbox.selection_set(0)
+        if len(rows) == self.limit:
+            self.status.set('First %d matches. Type more to narrow the list.'%(self.limit))
+        else:
+            self.status.set('%d matches'%(len(rows)))
+
+    @debugger
+    def cancel(self, event=None):
+        if not self.pending is None:
+            self.after_cancel(self.pending)
+            self.pending = None
+        super().cancel(event)
 
     @debugger
     def validate(self):
-        # Since the name was selected from the list, there is no need to
-        # validate.
+        if not self.pending is None:
+            # the list does not match the text yet
+            self.after_cancel(self.pending)
+            self.search()
+
+        if len(self.lbox.curselection()) == 0:
+            showerror('No Selection', 'No %s matches the name that was entered.'%(self.thing))
+            return False
         return True
 
     @debugger
     def apply(self):
         ''' Populate the form with the selected data. '''
-        id = self.data.get_id_by_name(self.table, self.column, self.cbb.get())
-        self.item_id = id
+        self.item_id = self.ids[self.lbox.curselection()[0]]
 
 ###############################################################################
 # Does not use BaseDialog
 class helpDialog:
 
     def __init__(self, parent):
-        self.logger = Logger(self, level=Logger.DEBUG)
+        self.logger = get_logger(self)
         self.logger.debug("enter constructor")
 
         self.top = tk.Toplevel(parent)
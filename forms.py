@@ -2,9 +2,10 @@
 import tkinter as tk
 from tkinter.messagebox import showerror, showinfo, askyesno
 import tkinter.ttk as ttk
-from utility import debugger, Logger
+from utility import debugger, Logger, get_logger
 from database import Database
 from dialogs import SelectItem
+from custom_widgets import RecordBrowser
 
 class ScrollableFrame:
     '''
@@ -17,7 +18,7 @@ class ScrollableFrame:
 
     def __init__(self, container, height=800, width=1000, *args, **kwargs):
 
-        self.logger = Logger(self, level=Logger.INFO)
+        self.logger = get_logger(self)
         self.logger.debug("enter constructor")
 
         self.canvas = tk.Canvas(container, height=height, width=width)
@@ -122,7 +123,7 @@ class Form: #(tk.Frame):
         width = the width of the form in pixels
         span = The number of columns in the form
         '''
-        self.logger = Logger(self, level=Logger.DEBUG)
+        self.logger = get_logger(self)
         self.logger.debug("enter constructor")
 
         self.notebook = notebook # container for the form.
@@ -136,21 +137,31 @@ class Form: #(tk.Frame):
 
         # database singleton object
         self.data = Database.get_instance()
-        # the rows may not be sequentially numbered.
-        if not table is None:
-            self.row_list = self.data.get_id_list(self.table)
-            self.row_index = 0
-        else:
-            self.row_list = None
-            self.row_index = 0
+        # ID of the record that the form shows. The first record is found when the form
+        # is loaded, and Next and Prev find the record next to it by ID, so the IDs of
+        # the whole table are never read.
+        self.row_id = None
 
         # dict of dicts that lists all of the controls by name.
         self.controls = {}
 
+        # The SELECT that reads a record together with the values that controls show
+        # from other tables, and the last record that was read with it.
+        self.record_sql = None
+        self.record = None
+
+        # The column values of the record as they were loaded into the controls, used
+        # to find what was changed. When new_record is True, Save inserts a new row.
+        self.snapshot = {}
+        self.new_record = False
+
+        # columns shown by the Browse button
+        self.browse_columns = ['name']
+
         # actual height and width of the form frame.
         self.height = height
         self.width = width
-        self.logger.debug("window size = %d, %d"%(self.height, self.width))
+        self.logger.debug("window size = %d, %d", self.height, self.width)
 
         # keep track of the current layout position.
         self.row = 0
@@ -203,7 +214,7 @@ class Form: #(tk.Frame):
         '''
         if not 'width' in kargs:
             kargs['width'] = self.ctrl_width
-        self.logger.debug("kargs = %s"%(str(kargs)))
+        self.logger.debug("kargs = %s", kargs)
 
         lab = tk.Label(self.ctl_frame, text=name+':')
 
@@ -275,7 +286,7 @@ class Form: #(tk.Frame):
         if not 'height' in kargs:
             kargs['height'] = self.text_height
 
-        self.logger.debug("kargs = %s"%(str(kargs)))
+        self.logger.debug("kargs = %s", kargs)
 
         frame = tk.Frame(self.ctl_frame, bd=1, relief=tk.RIDGE)
         text = tk.Text(frame, wrap=tk.NONE, **kargs)
@@ -369,8 +380,13 @@ class Form: #(tk.Frame):
             except tk.TclError:
                 pass # empty content is not an error
 
+        # the values are only set when the table has changed since the last time
+        version = [None]
         def populate():
-            combo['values'] = self.data.populate_list(table, 'name')
+            current = self.data.get_table_version(table)
+            if version[0] != current:
+                combo['values'] = self.data.get_ref_names(table, 'name')
+                version[0] = current
 
         self.controls[name] = {'column': column,
                                'table': table,
@@ -447,6 +463,8 @@ class Form: #(tk.Frame):
                 command = self.save_callback
             elif name == "Delete":
                 command = self.delete_callback
+            elif name == "Browse":
+                command = self.browse_callback
             else:
                 raise "unknown name and no command to exec"
 
@@ -509,31 +527,77 @@ class Form: #(tk.Frame):
         '''
         self.controls[name]['clear']()
 
+    @debugger
+    def get_column_values(self):
+        '''
+        Return a dict of the values in the controls by database column. Controls that
+        have no column or no value are left out.
+        '''
+        vals = {}
+        for item in self.controls:
+            col = self.controls[item]['column']
+            if col is None or col == '':
+                continue
+            cval = self.controls[item]['get']()
+            if not cval is None:
+                vals[col] = cval
+        return vals
+
     @debugger
     def commit_form(self):
         '''
         Write the contents of the form to the database. The form does not need to be
         visible for this to take place. Nothing is written to the database until this method
         is called. This assumes that all of the data is in the same table.
-        '''
-        if not self.row_list is None:
-            vals = {}
-            row_id = self.row_list[self.row_index]
-            for item in self.controls:
-                cval = self.controls[item]['get']()
-                col = self.controls[item]['column']
-                if not cval is None and col != '':
-                    vals[col] = cval
-            if self.data.if_rec_exists(self.table, 'ID', row_id):
-                self.data.update_row(self.table, vals, "ID=%d"%(row_id))
-            else:
-                self.data.insert_row(self.table, vals)
 
-            self.data.commit()
-            self.row_list = self.data.get_id_list(self.table)
+        A new record is inserted and becomes the one that the form shows. For an existing
+        record, only the columns that changed since it was loaded are written, and nothing
+        is written if none of them changed.
+        '''
+        if not self.table is None:
+            vals = self.get_column_values()
+            if self.new_record or self.row_id is None:
+                with self.data.transaction():
+                    self.row_id = self.data.insert_row(self.table, vals)
+                self.new_record = False
+                self.snapshot = vals
+            else:
+                changed = {}
+                for col in vals:
+                    if not col in self.snapshot or self.snapshot[col] != vals[col]:
+                        changed[col] = vals[col]
+
+                if len(changed) == 0:
+                    self.logger.debug("no changes to save")
+                    return
+
+                self.logger.debug("changed columns: %s", list(changed.keys()))
+                with self.data.transaction():
+                    self.data.update_row(self.table, changed, "ID=?", (self.row_id,))
+                self.snapshot.update(changed)
         else:
             self.logger.debug("Form has no table")
 
+    @debugger
+    def remove_row(self):
+        '''
+        Show the record that takes the place of the current one after it has been
+        deleted. That is the next one, or the one before it if it was the last one. If
+        there are none left the form is cleared.
+        '''
+        if not self.new_record and not self.row_id is None:
+            row_id = self.next_id(self.row_id)
+            if row_id is None:
+                row_id = self.next_id(self.row_id, True)
+            self.row_id = row_id
+        self.new_record = False
+
+        if not self.row_id is None:
+            self.load_form()
+        else:
+            self.clear_form()
+            self.snapshot = {}
+
 
     @debugger
     def load_form(self):
@@ -541,26 +605,77 @@ class Form: #(tk.Frame):
         Read the contents of the form from the database and place the values in the
         form controls. If the form is currently visible, then display the values.
         '''
-        if not self.row_list is None:
-            try:
-                row_id = self.row_list[self.row_index]
-                row = self.data.get_row_by_id(self.table, row_id)
+        if not self.table is None:
+            if self.row_id is None:
+                self.row_id = self.next_id(None)
+            row_id = self.row_id
+            if row_id is None:
+                row = None
+            else:
+                row = self.data.get_single_row(self.get_record_sql(), (row_id,))
+
+            if row is None:
+                showerror('No Records', 'No records exist for this form.')
+            else:
+                self.record = row
 
                 for item in self.controls:
                     if self.controls[item]['kind'] == Form.COMBO:
                         self.controls[item]['populate']()
                         self.controls[item]['set'](row[self.controls[item]['column']])
                     elif self.controls[item]['kind'] == Form.PRODUCT:
-                        self.controls[item]['set'](row_id)
+                        self.controls[item]['set'](row_id, row[self.controls[item]['view_col']])
                     elif self.controls[item]['kind'] == Form.DIR_BROWSER:
                         self.controls[item]['set']()
                     elif self.controls[item]['kind'] == Form.IMPORT_BTN:
                         self.controls[item]['set']()
+                    elif 'view_col' in self.controls[item]:
+                        self.controls[item]['set'](row[self.controls[item]['view_col']])
                     else:
                         self.controls[item]['set'](row[self.controls[item]['column']])
-            except IndexError as e:
-                showerror('No Records', 'No records exist for this form.\n\nThere are %d records in the table.'%(len(self.row_list)))
 
+                self.new_record = False
+                self.snapshot = self.get_column_values()
+
+    @debugger
+    def next_id(self, row_id, before=False):
+        '''
+        Return the ID of the record after the given one, or before it if before is
+        True. Use None for the first record. Returns None if there is no such record.
+        '''
+        if row_id is None:
+            after = None
+        else:
+            after = (row_id, row_id)
+        rows = self.data.get_page(self.table, [], 'ID', after, 1, before)
+        if len(rows) == 0:
+            return None
+        return rows[0]['ID']
+
+
+    @debugger
+    def get_record_sql(self):
+        '''
+        Return the SELECT that reads a record and everything that the controls show for
+        it in one query. A control that shows a value that is not a column of the form's
+        table has a 'view' entry. That is a tuple of the SQL expression for the value and
+        the join clause that it needs, or None. The form's table is called "t" in them.
+        The value is returned in the column named by the control's 'view_col' entry.
+        '''
+        if self.record_sql is None:
+            cols = ['t.*']
+            joins = []
+            for idx, item in enumerate(self.controls):
+                if 'view' in self.controls[item]:
+                    expr, join = self.controls[item]['view']
+                    self.controls[item]['view_col'] = 'view_%d'%(idx)
+                    cols.append('%s AS view_%d'%(expr, idx))
+                    if not join is None:
+                        joins.append(join)
+
+            self.record_sql = 'SELECT %s FROM %s t %s WHERE t.ID = ?;'%(', '.join(cols), self.table, ' '.join(joins))
+
+        return self.record_sql
 
     @debugger
     def configure_obj(self, name, **kargs):
@@ -574,12 +689,12 @@ class Form: #(tk.Frame):
         '''
         Default callback for the Prev button.
         '''
-        if not self.row_list is None:
-            self.row_index -= 1
-            if self.row_index < 0:
-                self.row_index = 0
+        if not self.table is None:
+            row_id = self.next_id(self.row_id, True)
+            if row_id is None:
                 showinfo('First Record', 'This is the first record.')
             else:
+                self.row_id = row_id
                 self.load_form()
 
     @debugger
@@ -587,12 +702,12 @@ class Form: #(tk.Frame):
         '''
         Default callback for the next button.
         '''
-        if not self.row_list is None:
-            self.row_index += 1
-            if self.row_index > len(self.row_list)-1:
-                self.row_index = len(self.row_list)-1
+        if not self.table is None:
+            row_id = self.next_id(self.row_id)
+            if row_id is None:
                 showinfo('Last Record', 'This is the last record.')
             else:
+                self.row_id = row_id
                 self.load_form()
 
     @debugger
@@ -602,19 +717,42 @@ class Form: #(tk.Frame):
         of all of the rows that are defined in the table. If the name field does not exist,
         throw an exception.
         '''
-        if not self.row_list is None:
+        if not self.table is None:
             item = SelectItem(self.owner, self.table, 'name')
-            self.row_index = self.row_list.index(item.item_id)
-            self.load_form()
+            if item.item_id >= 0:
+                self.show_record(item.item_id)
 
 
+    @debugger
+    def browse_callback(self):
+        '''
+        Default callback for the "Browse" button. This opens a window with a grid of the
+        records in the table. Selecting a record in the grid shows it in the form.
+        '''
+        if not self.table is None:
+            top = tk.Toplevel(self.owner)
+            top.title('Browse %s'%(self.table))
+            browser = RecordBrowser(top, self.table, self.browse_columns, command=self.show_record)
+            browser.pack(fill=tk.BOTH, expand=True)
+
+    @debugger
+    def show_record(self, row_id):
+        '''
+        Show the record with the given ID in the form.
+        '''
+        self.row_id = row_id
+        self.load_form()
+
     @debugger
     def new_callback(self):
         '''
         Default callback for the "New" button. This clears the form to default values.
+        The next save inserts a new record.
         '''
         for item in self.controls:
             self.controls[item]['clear']()
+        self.new_record = True
+        self.snapshot = {}
 
     @debugger
     def save_callback(self):
@@ -632,8 +770,10 @@ class Form: #(tk.Frame):
         row is displayed.
         '''
         if askyesno('Delete record?', 'Are you sure you want to delete this?'):
-            self.data.delete_row(self.table, self.row_list[self.row_index])
-            self.data.commit()
+            if not self.new_record:
+                with self.data.transaction():
+                    self.data.delete_row(self.table, self.row_id)
+            self.remove_row()
 
     @debugger
     def set_layout_row(self, num):
@@ -1,82 +1,305 @@
 
-from tkinter.messagebox import showwarning, showerror, showinfo
-import sys, os, csv
-from utility import Logger, debugger
+import sys, os, io, csv, time, math, hashlib
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from utility import Logger, get_logger, debugger
 from database import Database
 
 
+# The columns of a PayPal CSV file, in order. These are also the names of the
+# columns in the RawImport table.
+LEGEND = [
+    'Date',
+    'Time',
+    'TimeZone',
+    'Name',
+    'Type',
+    'Status',
+    'Currency',
+    'Gross',
+    'Fee',
+    'Net',
+    'FromEmail',
+    'ToEmail',
+    'TransactionID',
+    'ShippingAddress',
+    'AddressStatus',
+    'ItemTitle',
+    'ItemID',
+    'Shipping',
+    'InsuranceAmount',
+    'SalesTax',
+    'Option1Name',
+    'Option1Value',
+    'Option2Name',
+    'Option2Value',
+    'ReferenceTxnID',
+    'InvoiceNumber',
+    'CustomNumber',
+    'Quantity',
+    'ReceiptID',
+    'Balance',
+    'AddressLine1',
+    'AddressLine2',
+    'City',
+    'State',
+    'PostalCode',
+    'Country',
+    'Phone',
+    'Subject',
+    'Note',
+    'CountryCode',
+    'BalanceImpact']
+
+
+def find_records(fname, start, size):
+    '''
+    Split a CSV file from the byte offset start into pieces of about size bytes that
+    end at the end of a record. A newline only ends a record when it is not inside
+    of a quoted value, which is when the number of quotes before it is even. Returns
+    a list of (start, end) offsets.
+    '''
+    bounds = [start]
+    quotes = 0 # quotes from start to pos
+    pos = start
+    target = start + size
+    with open(fname, 'rb') as fh:
+        fh.seek(start)
+        while True:
+            block = fh.read(1024*1024)
+            if len(block) == 0:
+                break
+
+            while target < pos + len(block):
+                idx = block.find(b'\n', max(target - pos, 0))
+                while idx >= 0 and (quotes + block.count(b'"', 0, idx)) % 2 == 1:
+                    idx = block.find(b'\n', idx + 1)
+                if idx < 0:
+                    # the record goes on into the next block
+                    break
+                bounds.append(pos + idx + 1)
+                target = pos + idx + 1 + size
+
+            quotes += block.count(b'"')
+            pos += len(block)
+
+    if bounds[-1] < pos:
+        bounds.append(pos)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+def parse_records(fname, start, end, width):
+    '''
+    Parse the CSV records between two byte offsets that find_records() returned.
+    Returns a list of tuples of width columns. Short lines are padded with None and
+    blank lines, which PayPal exports often end with, are left out. This runs in a
+    separate process.
+    '''
+    with open(fname, 'rb') as fh:
+        fh.seek(start)
+        data = fh.read(end - start)
+
+    # decoded the same way as when the file is opened in text mode
+    reader = csv.reader(io.TextIOWrapper(io.BytesIO(data)))
+    return [tuple(line[:width]) + (None,)*(width-len(line)) for line in reader if len(line) > 0]
+
+class TransactionIndex(object):
+    '''
+    The TransactionIDs that are stored in RawImport, used to find duplicate lines in
+    memory instead of with a query for each line. Normally the IDs are kept in a set.
+    When bloom is True, only a Bloom filter of them is kept, which takes about 1.2
+    bytes per ID instead of about 100. An ID that the filter might have is checked
+    in the database, so the answer is still exact. IDs that have been added but not
+    written yet are kept in a set until flush() is called.
+    '''
+
+    def __init__(self, data, bloom=False, expected=0, error_rate=0.01):
+        self.logger = get_logger(self)
+        self.data = data
+        self.count = 0
+        self.lookups = 0 # database lookups for possible matches in the filter
+        self.pending = set()
+
+        if not bloom:
+            self.ids = set()
+            self.bits = None
+            for row in self.data.iter_column('RawImport', 'TransactionID'):
+                self.ids.add(row[0])
+            self.count = len(self.ids)
+        else:
+            self.ids = None
+            # The filter is sized for the stored IDs and the ones expected from the file.
+            # If more than that are added it only finds more possible matches.
+            n = max(self.data.get_count('RawImport') + expected, 1000)
+            self.size = int(-n * math.log(error_rate) / (math.log(2) ** 2))
+            self.hashes = max(1, round(self.size / n * math.log(2)))
+            self.bits = bytearray((self.size + 7) // 8)
+            for row in self.data.iter_column('RawImport', 'TransactionID'):
+                self._set_bits(row[0])
+                self.count += 1
+
+    def _positions(self, tid):
+        digest = hashlib.blake2b(str(tid).encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def _set_bits(self, tid):
+        for pos in self._positions(tid):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, tid):
+        if not self.ids is None:
+            return tid in self.ids
+
+        if tid in self.pending:
+            return True
+        for pos in self._positions(tid):
+            if not self.bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        self.lookups += 1
+        return self.data.if_rec_exists('RawImport', 'TransactionID', tid)
+
+    def add(self, tid):
+        self.count += 1
+        if not self.ids is None:
+            self.ids.add(tid)
+        else:
+            self.pending.add(tid)
+            self._set_bits(tid)
+
+    def flush(self):
+        '''
+        Called when the IDs that were added have been written to RawImport, where the
+        Bloom filter lookups can find them.
+        '''
+        if self.ids is None:
+            self.pending.clear()
+
+    def footprint(self):
+        '''
+        Return the approximate number of bytes of memory that the index uses.
+        '''
+        retv = sys.getsizeof(self.pending) + sum([sys.getsizeof(x) for x in self.pending])
+        if not self.ids is None:
+            retv += sys.getsizeof(self.ids) + sum([sys.getsizeof(x) for x in self.ids])
+        else:
+            retv += sys.getsizeof(self.bits)
+        return retv
+
+    def describe(self):
+        '''
+        Return a line of text about the index for the import summary.
+        '''
+        if self.ids is None:
+            return 'Duplicate check: Bloom filter of %d IDs, %.1f MB, %d database lookups'%(
+                        self.count, self.footprint() / (1024.0*1024.0), self.lookups)
+        return 'Duplicate check: set of %d IDs, %.1f MB'%(self.count, self.footprint() / (1024.0*1024.0))
+
 class ImportPayPal(object):
     '''
-    This class imports a PayPal CSV file into the database.
+    This class imports a PayPal CSV file into the database. It does not use any
+    widgets, so it can run in a worker thread with the worker's Database object.
+
+    The import is a series of stages. When it is run by a worker Task, each stage
+    reports its progress through the task as (stage name, stage number, number of
+    stages, rows processed, rows per second, fraction of the stage done), and the
+    import stops when the task is cancelled.
     '''
 
-    def __init__(self, fname):
-        self.logger = Logger(self, Logger.DEBUG)
+    def __init__(self, fname, data=None, task=None):
+        self.logger = get_logger(self)
         self.logger.debug(sys._getframe().f_code.co_name)
         self.fname = fname
 
-        self.data = Database.get_instance()
+        if data is None:
+            self.data = Database.get_instance()
+        else:
+            self.data = data
         self.accepted = 0
         self.rejected = 0
-        self.legend = [
-            'Date',
-            'Time',
-            'TimeZone',
-            'Name',
-            'Type',
-            'Status',
-            'Currency',
-            'Gross',
-            'Fee',
-            'Net',
-            'FromEmail',
-            'ToEmail',
-            'TransactionID',
-            'ShippingAddress',
-            'AddressStatus',
-            'ItemTitle',
-            'ItemID',
-            'Shipping',
-            'InsuranceAmount',
-            'SalesTax',
-            'Option1Name',
-            'Option1Value',
-            'Option2Name',
-            'Option2Value',
-            'ReferenceTxnID',
-            'InvoiceNumber',
-            'CustomNumber',
-            'Quantity',
-            'ReceiptID',
-            'Balance',
-            'AddressLine1',
-            'AddressLine2',
-            'City',
-            'State',
-            'PostalCode',
-            'Country',
-            'Phone',
-            'Subject',
-            'Note',
-            'CountryCode',
-            'BalanceImpact']
+        # rejected lines that have no TransactionID
+        self.no_id = 0
+        # the file's row in ImportedFileNames, the number of lines read from it and
+        # whether it has been imported in full
+        self.file_id = None
+        self.lines = 0
+        self.complete = False
+        # notes about the import that are shown with the summary
+        self.messages = []
+
+        self.task = task
+        # The stages of the import in the order that they are run.
+        self.stages = [
+            ('Reading file', self._read_file),
+            ('Countries', self._countries),
+            ('Customers', self._customers),
+            ('Vendors', self._vendors),
+            ('Sales', self._sales),
+            ('Purchases', self._purchases)]
+        self.stage_index = 0
+        self.stage_start = 0
+        # number of CSV lines that are written to the database at once
+        self.chunk_size = 5000
+        # The file is read and committed in pieces of about parse_bytes. When there is at
+        # least parallel_size left to read, the pieces are parsed by a pool of processes.
+        # The number of processes defaults to the number of CPUs. Set it to 1 to parse
+        # the pieces in this thread.
+        self.parallel_size = 64*1024*1024
+        self.parse_bytes = 8*1024*1024
+        self.processes = None
+        # When RawImport has this many rows or more, duplicate lines are found with a
+        # Bloom filter instead of a set of all of the TransactionIDs.
+        self.bloom_size = 5000000
+        self.legend = LEGEND
+        # status columns in RawImport that are not part of the CSV file
+        self.flags = [
+            'imported_country',
+            'imported_customer',
+            'imported_vendor',
+            'imported_sale',
+            'imported_purchase']
 
     @debugger
     def import_all(self):
         '''
         This is the top level interface for the importer. All of the other methods
-        are private.
+        are private. Returns the text of a summary of the import.
+
+        The file is read into RawImport in pieces that are each committed with the
+        position that the file has been read up to, which is kept in ImportedFileNames.
+        If the import is stopped while reading, then the next import of the same file
+        carries on from there. A file that was imported in full is not read again. The
+        stages after reading are one transaction, so if one of them fails or the import
+        is cancelled, none of them are kept.
         '''
-        self.logger.debug("import all records from %s"%(self.fname))
-        #try:
-        # import the CSV file into the database.
-        self._read_file()
-        # get the various tables set up
-        codes = self._countries()
-        cust = self._customers()
-        vend = self._vendors()
-        sales = self._sales()
-        purch = self._purchases()
+        self.logger.debug("import all records from %s", self.fname)
+        results = []
+        with self.data.use_profile('bulk'):
+            if not self.task is None:
+                # lets a cancel stop a long statement part way through
+                self.data.set_progress_handler(self.task.cancelled.is_set)
+            try:
+                self._start_stage(0)
+                results.append(self.stages[0][1]())
+                if not self.complete:
+                    with self.data.transaction():
+                        for idx in range(1, len(self.stages)):
+                            self._start_stage(idx)
+                            results.append(self.stages[idx][1]())
+                        self.data.update_row('ImportedFileNames', {'complete': True}, 'ID=?', (self.file_id,))
+            except Exception:
+                # SQLite reports an interrupted statement as an error
+                self._check()
+                raise
+            finally:
+                if not self.task is None:
+                    self.data.set_progress_handler(None)
+
+        if self.complete:
+            return '\n'.join(self.messages)
+
+        codes, cust, vend, sales, purch = results[1:]
 
         text = 'Imported records:\n'
         text += '   %d country codes\n'%(codes)
@@ -86,140 +309,275 @@ class ImportPayPal(object):
         text += '   %d purchase entries\n'%(purch)
         text += '   %d CSV lines accepted\n'%(self.accepted)
         text += '   %d CSV lines rejected\n'%(self.rejected)
+        for msg in self.messages:
+            text += '\n%s'%(msg)
 
-        showinfo('Import', text)
+        return text
 
-#        except Exception as e:
-#            showerror('ERROR', str(e))
+    def _start_stage(self, idx):
+        self.stage_index = idx
+        self.stage_start = time.time()
+        self.logger.debug("import stage: %s", self.stages[idx][0])
+        self._progress(0, 0.0)
 
-    @debugger
-    def _read_file(self):
+    def _check(self):
         '''
-        Read the CSV file into an array of lines where each one is a dictionary with the
-        column names as keys.
+        Raise TaskCancelled if the import has been cancelled.
         '''
-        with open(self.fname, "r") as fh:
-            reader = csv.reader(fh)
-
-            line = []
-            for line in reader:
-                break
-
-            if not line[1] == 'Time':
-                raise('File selected is not a PayPal CSV import file.')
+        if not self.task is None:
+            self.task.check()
 
+    def _progress(self, rows, fraction):
+        '''
+        Report the progress of the current stage and stop if the import has been
+        cancelled. Rows is the number of rows that the stage has processed.
+        '''
+        if self.task is None:
+            return
+
+        self.task.check()
+        elapsed = time.time() - self.stage_start
+        if elapsed > 0:
+            rate = rows / elapsed
+        else:
+            rate = 0.0
+        self.task.report(self.stages[self.stage_index][0], self.stage_index, len(self.stages),
+                         rows, rate, fraction)
 
-            for line in reader:
-                rec = {}
-                for idx, item in enumerate(line):
-                    #if item == '':
-                    #    rec[self.legend[idx]] = None
-                    #else:
-                    rec[self.legend[idx]] = item
-                    rec['imported_country'] = False
-                    rec['imported_customer'] = False
-                    rec['imported_vendor'] = False
-                    rec['imported_sale'] = False
-                    rec['imported_purchase'] = False
+    @debugger
+    def _read_file(self):
+        '''
+        Read the CSV file into the RawImport table. The file is split into pieces of about
+        parse_bytes that end on a record boundary, and each piece is written chunk_size
+        lines at a time with executemany and committed along with the position in the
+        file where it ends. Lines with a TransactionID that is already stored, or that was
+        already seen in this file, are rejected. Returns the number of lines accepted.
+
+        When there are parallel_size bytes or more left to read, the pieces are parsed by
+        a pool of processes. They are still stored in file order by this thread, so the
+        result is the same as parsing them here.
+        '''
+        size = os.path.getsize(self.fname)
+        with open(self.fname, "rb") as fh:
+            header = fh.readline()
+        self._check_header(next(csv.reader(io.TextIOWrapper(io.BytesIO(header))), []))
 
-                if not self.data.if_rec_exists('RawImport', 'TransactionID', rec['TransactionID']):
-                    self.data.insert_row('RawImport', rec)
-                    self.accepted += 1
-                else:
-                    self.rejected += 1
+        start = self._find_file(size, len(header))
+        if self.complete:
+            return 0
 
-            self.data.commit()
+        width = len(self.legend)
+        bloom = self.data.get_count('RawImport') >= self.bloom_size
+        # the lines left in the file are guessed for sizing the Bloom filter
+        seen = TransactionIndex(self.data, bloom, (size - start) // 150)
+        self.logger.info(seen.describe())
+        pieces = find_records(self.fname, start, self.parse_bytes)
+        self.logger.debug("reading %d pieces of %s", len(pieces), self.fname)
+
+        processes = self.processes
+        if processes is None:
+            processes = os.cpu_count() or 1
+
+        if processes == 1 or size - start < self.parallel_size:
+            for start, end in pieces:
+                self._store_piece(end, parse_records(self.fname, start, end, width), seen, size)
+        else:
+            # Processes are started with spawn because this may run in a worker thread.
+            # Only a few pieces are parsed ahead of the writer, so the whole file is not
+            # held in memory.
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(processes, mp_context=context) as pool:
+                pending = deque()
+                for start, end in pieces:
+                    pending.append((end, pool.submit(parse_records, self.fname, start, end, width)))
+                    if len(pending) > processes * 2:
+                        end, future = pending.popleft()
+                        self._store_piece(end, future.result(), seen, size)
+
+                while len(pending) > 0:
+                    end, future = pending.popleft()
+                    self._store_piece(end, future.result(), seen, size)
+
+        if self.no_id > 0:
+            self.messages.append('%d lines without a TransactionID were left out.'%(self.no_id))
+        self.messages.append(seen.describe())
+        return self.accepted
+
+    def _find_file(self, size, start):
+        '''
+        Look the file up in ImportedFileNames by the hash of its contents and add it if
+        it is not there. Sets self.complete if it was imported in full. Returns the
+        position in the file to read from, which is start for a new file.
+        '''
+        digest = hashlib.sha256()
+        with open(self.fname, 'rb') as fh:
+            while True:
+                block = fh.read(1024*1024)
+                if len(block) == 0:
+                    break
+                digest.update(block)
+        digest = digest.hexdigest()
+
+        row = self.data.get_single_row('''SELECT * FROM ImportedFileNames WHERE hash = ?
+                                          ORDER BY complete DESC, ID DESC LIMIT 1;''', (digest,))
+        if row is None:
+            with self.data.transaction():
+                self.file_id = self.data.insert_row('ImportedFileNames', {
+                                    'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+                                    'name': self.fname,
+                                    'hash': digest,
+                                    'size': size,
+                                    'byte_offset': start,
+                                    'line_count': 0,
+                                    'complete': False})
+            return start
+
+        self.file_id = row['ID']
+        self.lines = row['line_count']
+        if row['complete']:
+            self.complete = True
+            self.messages.append('This file was already imported on %s.'%(row['date']))
+        elif row['byte_offset'] >= size:
+            self.messages.append('This file was read in full before, only the rest of the import was run again.')
+        elif row['byte_offset'] > start:
+            self.messages.append('The import of this file was continued from line %d.'%(self.lines + 1))
+        return row['byte_offset']
+
+    def _store_piece(self, end, recs, seen, size):
+        '''
+        Write the records from a piece of the file and the position in the file where
+        the piece ends in one transaction.
+        '''
+        with self.data.transaction():
+            for idx in range(0, len(recs), self.chunk_size):
+                self._store(recs[idx:idx+self.chunk_size], seen)
+            self.lines += len(recs)
+            self.data.update_row('ImportedFileNames', {'byte_offset': end, 'line_count': self.lines},
+                                 'ID=?', (self.file_id,))
+        self._progress(self.accepted + self.rejected, end / max(size, 1))
+
+    def _check_header(self, line):
+        if len(line) < 2 or not line[1] == 'Time':
+            raise Exception('File selected is not a PayPal CSV import file.')
+
+    def _store(self, recs, seen):
+        '''
+        Write a list of records to the RawImport table, leaving out the ones with a
+        TransactionID that has been seen. Lines without a TransactionID, such as short
+        lines, are left out too because they cannot be checked for duplicates.
+        '''
+        tid = self.legend.index('TransactionID')
+        flags = tuple([False]*len(self.flags))
+        rows = []
+        for rec in recs:
+            if rec[tid] is None or rec[tid] == '':
+                self.no_id += 1
+                self.rejected += 1
+            elif rec[tid] in seen:
+                self.rejected += 1
+            else:
+                seen.add(rec[tid])
+                rows.append(rec + flags)
+
+        if len(rows) > 0:
+            self.accepted += self.data.insert_rows('RawImport', self.legend + self.flags, rows)
+        seen.flush()
 
     @debugger
     def _countries(self):
         '''
-        Read the new import and copy new country codes into the country codes table.
+        Read the new import and copy new country codes into the country codes table. The
+        first row that has a country code gives the name of the country.
         '''
-        data = self.data.get_row_list('RawImport', 'imported_country = false')
-        if data is None:
+        if self.data.get_count('RawImport', 'imported_country = false') == 0:
             return 0
 
-        count = 0
-        for item in data:
-            if item['CountryCode'] != '' and not self.data.if_rec_exists('Country', 'abbreviation', item['CountryCode']):
-                rec = {'name': item['Country'],
-                        'abbreviation': item['CountryCode']}
-                self.data.insert_row('Country', rec)
-                count += 1
-            self.data.update_row_by_id('RawImport', {'imported_country':True}, item['ID'])
+        with self.data.transaction():
+            count = self.data.execute('''INSERT INTO Country (name, abbreviation)
+                SELECT r.Country, r.CountryCode FROM RawImport r
+                WHERE r.ID IN (SELECT MIN(ID) FROM RawImport
+                               WHERE imported_country = false AND CountryCode != ''
+                               GROUP BY CountryCode)
+                AND NOT EXISTS (SELECT 1 FROM Country c WHERE c.abbreviation = r.CountryCode)
+                ORDER BY r.ID;''').rowcount
+
+            self.data.execute('UPDATE RawImport SET imported_country = true WHERE imported_country = false;')
 
-        self.data.commit()
+        self._progress(count, 1.0)
         return count
 
     @debugger
     def _customers(self):
         '''
-        Find all of the new customer records and copy the data into the customers table.
+        Find all of the new customer records and copy the data into the customers table. The
+        first row that has a new name is used to create the customer.
         '''
-        data = self.data.get_row_list('RawImport', 'imported_customer = false and BalanceImpact = \'Credit\'')
-        if data is None:
-            showinfo('INFO', 'There are no customer contacts to import.')
+        where = 'imported_customer = false AND BalanceImpact = ? AND Type IN (?, ?)'
+        params = ('Credit', 'Website Payment', 'General Payment')
+        if self.data.get_count('RawImport', 'imported_customer = false and BalanceImpact = ?', ('Credit',)) == 0:
+            self.messages.append('There are no customer contacts to import.')
             return 0
 
-        count = 0
-        for item in data:
-            if item['Type'] == 'Website Payment' or item['Type'] == 'General Payment':
-                # Yes it's a customer
-                if not self.data.if_rec_exists('Customer', 'name', item['Name']):
-                    rec = { 'date_created': item['Date'],
-                            'name': item['Name'],
-                            'address1': item['AddressLine1'],
-                            'address2': item['AddressLine2'],
-                            'state': item['State'],
-                            'city': item['City'],
-                            'zip': item['PostalCode'],
-                            'email_address': item['FromEmail'],
-                            'email_status_ID': self.data.get_id_by_row('EmailStatus', 'name', 'primary'),
-                            'phone_number': item['Phone'],
-                            'phone_status_ID': self.data.get_id_by_row('PhoneStatus', 'name', 'primary'),
-                            'description': 'Imported from PayPal',
-                            'notes': item['Subject'],
-                            'country_ID': self.data.get_id_by_row('Country', 'abbreviation', item['CountryCode']),
-                            'class_ID': self.data.get_id_by_row('ContactClass', 'name', 'retail')}
-
-                    self.data.insert_row('Customer', rec)
-                    count+=1
-                # BUG: (fixed) When there are multiple instances of a name, the sale or purch record does not get imported
-                # because the imported_customer field does not get updated due to the duplicate name interlock.
-                self.data.update_row_by_id('RawImport', {'imported_customer':True}, item['ID'])
-        self.data.commit()
+        with self.data.transaction():
+            count = self.data.execute('''INSERT INTO Customer (date_created, name, address1, address2,
+                    state, city, zip, email_address, email_status_ID, phone_number, phone_status_ID,
+                    description, notes, country_ID, class_ID)
+                SELECT r.Date, r.Name, r.AddressLine1, r.AddressLine2,
+                    r.State, r.City, r.PostalCode, r.FromEmail, ?, r.Phone, ?,
+                    'Imported from PayPal', r.Subject,
+                    (SELECT MIN(c.ID) FROM Country c WHERE c.abbreviation = r.CountryCode), ?
+                FROM RawImport r
+                WHERE r.ID IN (SELECT MIN(ID) FROM RawImport WHERE %s GROUP BY Name)
+                AND NOT EXISTS (SELECT 1 FROM Customer c WHERE c.name = r.Name)
+                ORDER BY r.ID;'''%(where),
+                (self.data.get_ref_id('EmailStatus', 'name', 'primary'),
+                 self.data.get_ref_id('PhoneStatus', 'name', 'primary'),
+                 self.data.get_ref_id('ContactClass', 'name', 'retail')) + params).rowcount
+
+            # BUG: (fixed) When there are multiple instances of a name, the sale or purch record does not get imported
+            # because the imported_customer field does not get updated due to the duplicate name interlock.
+            self.data.execute('UPDATE RawImport SET imported_customer = true WHERE %s;'%(where), params)
+
+        self._progress(count, 1.0)
         return count
 
     @debugger
     def _vendors(self):
         '''
-        Find all of the new vendor records and copy the data into the vendor table.
+        Find all of the new vendor records and copy the data into the vendor table. Only the
+        rows that the vendors are created from are marked as imported.
         '''
-        data = self.data.get_row_list('RawImport', 'imported_vendor = false and BalanceImpact = \'Debit\'')
-        if data is None:
-            showinfo('INFO', 'There are no customer contacts to import.')
+        if self.data.get_count('RawImport', 'imported_vendor = false and BalanceImpact = ?', ('Debit',)) == 0:
+            self.messages.append('There are no vendor contacts to import.')
             return 0
 
-        count = 0
-        for item in data:
-            if item['Name'] != '' and item['Name'] != 'PayPal':
-                if not self.data.if_rec_exists('Vendor', 'name', item['Name']):
-                    rec = { 'date_created': item['Date'],
-                            'name': item['Name'],
-                            'contact_name':'',
-                            'email_address': item['ToEmail'],
-                            'email_status_ID': self.data.get_id_by_row('EmailStatus', 'name', 'primary'),
-                            'phone_number': '',
-                            'phone_status_ID': self.data.get_id_by_row('PhoneStatus', 'name', 'primary'),
-                            'description': item['ItemTitle'],
-                            'notes': item['Subject'],
-                            'type_ID': self.data.get_id_by_row('VendorType', 'name', 'unknown'),}
-
-                    self.data.insert_row('Vendor', rec)
-                    self.data.update_row_by_id('RawImport', {'imported_vendor':True}, item['ID'])
-                    count+=1
-
-        self.data.commit()
+        with self.data.transaction():
+            # The source rows have to be saved before the vendors are created because the
+            # vendor name is what selects them.
+            self.data.execute('CREATE TEMP TABLE IF NOT EXISTS ImportSource (ID INTEGER PRIMARY KEY);')
+            self.data.execute('DELETE FROM ImportSource;')
+            self.data.execute('''INSERT INTO ImportSource (ID)
+                SELECT MIN(r.ID) FROM RawImport r
+                WHERE r.imported_vendor = false AND r.BalanceImpact = ? AND r.Name NOT IN ('', 'PayPal')
+                AND NOT EXISTS (SELECT 1 FROM Vendor v WHERE v.name = r.Name)
+                GROUP BY r.Name;''', ('Debit',))
+
+            count = self.data.execute('''INSERT INTO Vendor (date_created, name, contact_name,
+                    email_address, email_status_ID, phone_number, phone_status_ID,
+                    description, notes, type_ID)
+                SELECT r.Date, r.Name, '', r.ToEmail, ?, '', ?, r.ItemTitle, r.Subject, ?
+                FROM RawImport r
+                WHERE r.ID IN (SELECT ID FROM ImportSource)
+                ORDER BY r.ID;''',
+                (self.data.get_ref_id('EmailStatus', 'name', 'primary'),
+                 self.data.get_ref_id('PhoneStatus', 'name', 'primary'),
+                 self.data.get_ref_id('VendorType', 'name', 'unknown'))).rowcount
+
+            self.data.execute('''UPDATE RawImport SET imported_vendor = true
+                WHERE ID IN (SELECT ID FROM ImportSource);''')
+            self.data.execute('DELETE FROM ImportSource;')
+
+        self._progress(count, 1.0)
         return count
 
     @debugger
@@ -227,30 +585,26 @@ class ImportPayPal(object):
         '''
         Find the sales records and copy the data into the sales database table.
         '''
-        data = self.data.get_row_list('RawImport', 'imported_sale = false and imported_customer = true and BalanceImpact = \'Credit\'')
-        if data is None:
-            showinfo('INFO', 'There are no sales transcations to import.')
+        where = '''imported_sale = false AND imported_customer = true AND BalanceImpact = ?
+            AND Name NOT IN ('', 'PayPal')'''
+        if self.data.get_count('RawImport', 'imported_sale = false and imported_customer = true and BalanceImpact = ?', ('Credit',)) == 0:
+            self.messages.append('There are no sales transactions to import.')
             return 0
 
-        count = 0
-        for item in data:
-            if item['Name'] != '' and item['Name'] != 'PayPal':
-                rec = { 'date': item['Date'],
-                        'customer_ID': self.data.get_id_by_row('Customer', 'name', item['Name']),
-                        'raw_import_ID': int(item['ID']),
-                        'status_ID': self.data.get_id_by_row('SaleStatus', 'name', 'complete'),
-                        'transaction_uuid': item['TransactionID'],
-                        'gross': self.data.convert_value(item['Gross'], float),
-                        'fees': self.data.convert_value(item['Fee'], float),
-                        'shipping': self.data.convert_value(item['Shipping'], float),
-                        'notes': item['Subject'] + '\n' +item['ItemTitle'],
-                        'committed': False}
-
-                self.data.insert_row('SaleRecord', rec)
-                count+=1
-                self.data.update_row_by_id('RawImport', {'imported_sale':True}, item['ID'])
-
-        self.data.commit()
+        with self.data.transaction():
+            count = self.data.execute('''INSERT INTO SaleRecord (date, customer_ID, raw_import_ID,
+                    status_ID, transaction_uuid, gross, fees, shipping, notes, committed)
+                SELECT r.Date, (SELECT MIN(c.ID) FROM Customer c WHERE c.name = r.Name), r.ID,
+                    ?, r.TransactionID, to_amount(r.Gross), to_amount(r.Fee), to_amount(r.Shipping),
+                    r.Subject || char(10) || r.ItemTitle, false
+                FROM RawImport r
+                WHERE %s
+                ORDER BY r.ID;'''%(where),
+                (self.data.get_ref_id('SaleStatus', 'name', 'complete'), 'Credit')).rowcount
+
+            self.data.execute('UPDATE RawImport SET imported_sale = true WHERE %s;'%(where), ('Credit',))
+
+        self._progress(count, 1.0)
         return count
 
     @debugger
@@ -258,32 +612,25 @@ class ImportPayPal(object):
         '''
         Find all of the purchase records and copy the data into the purchase database table.
         '''
-        data = self.data.get_row_list('RawImport', 'imported_purchase = false and imported_vendor = true and BalanceImpact = \'Debit\'')
-        if data is None:
-            showinfo('INFO', 'There are no purchase transcations to import.')
+        where = '''imported_purchase = false AND imported_vendor = true AND BalanceImpact = ?
+            AND Name NOT IN ('', 'PayPal')'''
+        if self.data.get_count('RawImport', 'imported_purchase = false and imported_vendor = true and BalanceImpact = ?', ('Debit',)) == 0:
+            self.messages.append('There are no purchase transactions to import.')
             return 0
 
-        count = 0
-        for item in data:
-            if item['Name'] != '' and item['Name'] != 'PayPal':
-                gross = item['Gross']
-                tax = item['SalesTax']
-                shipping = item['Shipping']
-                rec = { 'date': item['Date'],
-                        'raw_import_ID': int(item['ID']),
-                        'vendor_ID': self.data.get_id_by_row('Vendor', 'name', item['Name']),
-                        'status_ID': self.data.get_id_by_row('PurchaseStatus', 'name', 'complete'),
-                        'type_ID': self.data.get_id_by_row('PurchaseType', 'name', 'unknown'),
-                        'transaction_uuid': item['TransactionID'],
-                        'gross': self.data.convert_value(item['Gross'], float),
-                        'tax': self.data.convert_value(item['SalesTax'], float),
-                        'shipping': self.data.convert_value(item['Shipping'], float),
-                        'notes': item['Subject'] + '\n' +item['ItemTitle'],
-                        'committed': False}
-
-                self.data.insert_row('PurchaseRecord', rec)
-                self.data.update_row_by_id('RawImport', {'imported_purchase':True}, item['ID'])
-                count+=1
-
-        self.data.commit()
+        with self.data.transaction():
+            count = self.data.execute('''INSERT INTO PurchaseRecord (date, raw_import_ID, vendor_ID,
+                    status_ID, type_ID, transaction_uuid, gross, tax, shipping, notes, committed)
+                SELECT r.Date, r.ID, (SELECT MIN(v.ID) FROM Vendor v WHERE v.name = r.Name),
+                    ?, ?, r.TransactionID, to_amount(r.Gross), to_amount(r.SalesTax), to_amount(r.Shipping),
+                    r.Subject || char(10) || r.ItemTitle, false
+                FROM RawImport r
+                WHERE %s
+                ORDER BY r.ID;'''%(where),
+                (self.data.get_ref_id('PurchaseStatus', 'name', 'complete'),
+                 self.data.get_ref_id('PurchaseType', 'name', 'unknown'), 'Debit')).rowcount
+
+            self.data.execute('UPDATE RawImport SET imported_purchase = true WHERE %s;'%(where), ('Debit',))
+
+        self._progress(count, 1.0)
         return count
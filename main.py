@@ -3,8 +3,10 @@ import sys, traceback
 
 import tkinter as tk
 import tkinter.ttk as ttk
-from utility import Logger, debugger
+from utility import Logger, get_logger, LogSink, debugger
 from main_notebook import MainNotebook
+from database import Database
+from workers import WorkerPool
 #from setup_notebook import SetupNotebook
 
 
@@ -15,13 +17,14 @@ class MainFrame(tk.Frame):
     '''
 
     def __init__(self):
-        self.logger = Logger(self, Logger.DEBUG)
+        self.logger = get_logger(self)
         self.logger.debug(sys._getframe().f_code.co_name)
 
         self.master = tk.Tk()
         self.master.geometry('1000x800')
         #self.master.resizable(0, 0)
         self.master.wm_title("Accounting")
+        WorkerPool.get_instance().set_master(self.master)
 
         MainNotebook(self.master)
         #self.main_notebook = MainNotebook(self.master)
@@ -36,11 +39,14 @@ class MainFrame(tk.Frame):
         try:
             self.logger.debug("start main loop")
             self.master.mainloop()
+            WorkerPool.get_instance().shutdown()
+            Database.get_instance().dump_query_stats()
             self.logger.debug('close database')
             #self.data.close()
             self.logger.debug("end main loop")
 
         except Exception:
+            LogSink.get_instance().dump()
             traceback.print_exception(*sys.exc_info())
 
 if __name__ == "__main__":
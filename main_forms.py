@@ -2,7 +2,7 @@
 import sys
 import tkinter as tk
 import tkinter.ttk as ttk
-from utility import Logger, debugger
+from utility import Logger, get_logger, debugger
 from forms import Form
 from setup_notebook import SetupNotebook
 
@@ -12,7 +12,7 @@ class MainHomeForm(Form):
     '''
 
     def __init__(self, notebook):
-        self.logger = Logger(self, Logger.DEBUG)
+        self.logger = get_logger(self)
         self.logger.debug(sys._getframe().f_code.co_name)
         super().__init__(notebook, notebook.HOME_FRAME, 'Business')
 
@@ -44,7 +44,7 @@ class MainSalesForm(Form):
     '''
 
     def __init__(self, notebook):
-        self.logger = Logger(self, Logger.DEBUG)
+        self.logger = get_logger(self)
         self.logger.debug(sys._getframe().f_code.co_name)
         super().__init__(notebook, notebook.SALES_FRAME, 'Business')
 
@@ -56,7 +56,7 @@ class MainPurchaseForm(Form):
     '''
 
     def __init__(self, notebook):
-        self.logger = Logger(self, Logger.DEBUG)
+        self.logger = get_logger(self)
         self.logger.debug(sys._getframe().f_code.co_name)
         super().__init__(notebook, notebook.PURCHASE_FRAME, 'Business')
 
@@ -68,7 +68,7 @@ class MainReportsForm(Form):
     '''
 
     def __init__(self, notebook):
-        self.logger = Logger(self, Logger.DEBUG)
+        self.logger = get_logger(self)
         self.logger.debug(sys._getframe().f_code.co_name)
         super().__init__(notebook, notebook.REPORTS_FRAME, 'Business')
 
@@ -80,7 +80,7 @@ class MainSetupForm(Form):
     '''
 
     def __init__(self, notebook):
-        self.logger = Logger(self, Logger.DEBUG)
+        self.logger = get_logger(self)
         self.logger.debug(sys._getframe().f_code.co_name)
         super().__init__(notebook, notebook.SETUP_FRAME, 'Business')
 
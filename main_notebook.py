@@ -1,7 +1,7 @@
 
 
 from notebook import NotebookBase
-from utility import Logger, debugger
+from utility import Logger, get_logger, debugger
 from main_forms import *
 
 class MainNotebook(NotebookBase):
@@ -13,14 +13,14 @@ class MainNotebook(NotebookBase):
     SETUP_FRAME = 4
 
     def __init__(self, master):
-        self.logger = Logger(self, level=Logger.DEBUG)
+        self.logger = get_logger(self)
         self.logger.debug(sys._getframe().f_code.co_name)
         super().__init__(master, ['Home', 'Sales', 'Purchase', 'Reports', 'Setup'])
 
-        MainHomeForm(self)
-        MainSalesForm(self)
-        MainPurchaseForm(self)
-        MainReportsForm(self)
-        MainSetupForm(self)
+        self.register_form(self.HOME_FRAME, MainHomeForm)
+        self.register_form(self.SALES_FRAME, MainSalesForm)
+        self.register_form(self.PURCHASE_FRAME, MainPurchaseForm)
+        self.register_form(self.REPORTS_FRAME, MainReportsForm)
+        self.register_form(self.SETUP_FRAME, MainSetupForm)
 
         self.show_frame(self.HOME_FRAME)
@@ -7,7 +7,7 @@ There are 2 frames. The top frame holds the buttons and the bottom frame holds c
 
 import tkinter as tk
 import tkinter.ttk as ttk
-from utility import debugger, Logger
+from utility import debugger, Logger, get_logger
 
 class Notebook(tk.Frame):
     '''
@@ -30,7 +30,7 @@ class Notebook(tk.Frame):
     def __init__(self, master, height=700, width=1000, **kwargs):
 
         super().__init__(master, **kwargs)
-        self.logger = Logger(self, level=Logger.DEBUG)
+        self.logger = get_logger(self)
         self.logger.debug("enter constructor")
 
         self.master = master
@@ -50,7 +50,7 @@ class Notebook(tk.Frame):
     @debugger
     def show_frame(self, index):
 
-        self.logger.debug('index: %d'%(index))
+        self.logger.debug('index: %d', index)
         #if not self.callback is None:
         #    self.callback()
 
@@ -69,7 +69,7 @@ class Notebook(tk.Frame):
         '''
         Use this to get the frame to bind widgets to.
         '''
-        self.logger.debug("index: %d"%(index))
+        self.logger.debug("index: %d", index)
         return self.frame_list[index]['frame']
 
     @debugger
@@ -78,7 +78,7 @@ class Notebook(tk.Frame):
         Add a new tab to the notebook.
         '''
         panel_frame = {}
-        self.logger.debug("title: \'%s\'"%(title))
+        self.logger.debug("title: \'%s\'", title)
         panel_frame['frame'] = tk.Frame(self.wid_frame, height=self.height, width=self.width)
 
         btn = tk.Button(self.btn_frame, text=title, width=10, relief=tk.RAISED, command=lambda idx=self.frame_index: self.show_frame(idx))
@@ -100,7 +100,7 @@ class Notebook(tk.Frame):
 class NotebookBase(Notebook):
 
     def __init__(self, master, names=None, height=700, width=1000):
-        self.logger = Logger(self, level=Logger.DEBUG)
+        self.logger = get_logger(self)
         self.logger.debug("enter constructor")
         super().__init__(master, height=height, width=width)
 
@@ -111,6 +111,36 @@ class NotebookBase(Notebook):
 
         self.form_class = []
 
+        # Forms are not built until their tab is shown for the first time. The
+        # factory for a tab is called with the notebook as its only argument.
+        self.form_factories = {}
+        self.forms = {}
+
+    @debugger
+    def register_form(self, index, factory):
+        '''
+        Register the factory, usually the form class, that builds the form for a tab.
+        '''
+        self.form_factories[index] = factory
+
+    @debugger
+    def get_built_form(self, index):
+        '''
+        Return the form for a tab, building it if it has not been shown yet.
+        '''
+        if not index in self.forms and index in self.form_factories:
+            self.logger.debug('build form for tab %d', index)
+            self.forms[index] = self.form_factories[index](self)
+        return self.forms.get(index)
+
+    @debugger
+    def show_frame(self, index):
+        '''
+        Show a tab. The form for the tab is built the first time.
+        '''
+        self.get_built_form(index)
+        super().show_frame(index)
+
     @debugger
     def get_name(self, index):
         return self.names[index]
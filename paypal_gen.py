@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+'''
+Make PayPal CSV files full of made up transactions to test and time the importer
+with. The same options and seed always make the same file.
+
+    python3 paypal_gen.py test.csv --rows 100000 --customers 5000 --vendors 200
+'''
+import csv, random, argparse, datetime
+from collections import deque
+from importer import LEGEND
+
+# The names that PayPal puts in the first line of the file. They are in the same
+# order as the LEGEND.
+HEADER = [
+    'Date', 'Time', 'TimeZone', 'Name', 'Type', 'Status', 'Currency', 'Gross', 'Fee', 'Net',
+    'From Email Address', 'To Email Address', 'Transaction ID', 'Shipping Address',
+    'Address Status', 'Item Title', 'Item ID', 'Shipping and Handling Amount',
+    'Insurance Amount', 'Sales Tax', 'Option 1 Name', 'Option 1 Value', 'Option 2 Name',
+    'Option 2 Value', 'Reference Txn ID', 'Invoice Number', 'Custom Number', 'Quantity',
+    'Receipt ID', 'Balance', 'Address Line 1', 'Address Line 2/District/Neighborhood',
+    'Town/City', 'State/Province/Region/County/Territory/Prefecture/Republic',
+    'Zip/Postal Code', 'Country', 'Contact Phone Number', 'Subject', 'Note', 'Country Code',
+    'Balance Impact']
+
+FIRST_NAMES = ['James', 'Mary', 'Robert', 'Patricia', 'John', 'Jennifer', 'Michael', 'Linda',
+               'David', 'Elizabeth', 'William', 'Barbara', 'Richard', 'Susan', 'Joseph', 'Jessica',
+               'Thomas', 'Sarah', 'Carlos', 'Maria', 'Hans', 'Ingrid', 'Pierre', 'Amelie']
+LAST_NAMES = ['Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis',
+              'Rodriguez', 'Martinez', "O'Brien", 'Wilson', 'Anderson', 'Taylor', 'Thomas',
+              'Moore', 'Jackson', 'Martin', 'Lee', 'Mueller', 'Dubois', 'Schmidt', 'Rossi']
+STREETS = ['Main St', 'Oak Ave', 'Maple Dr', 'Cedar Ln', 'Elm St', 'Pine Rd', 'Lake View Blvd',
+           'Hill St', 'River Rd', 'Park Ave']
+CITIES = [('Springfield', 'IL'), ('Portland', 'OR'), ('Austin', 'TX'), ('Columbus', 'OH'),
+          ('Denver', 'CO'), ('Raleigh', 'NC'), ('Madison', 'WI'), ('Tucson', 'AZ')]
+# (code, name, weight) of the countries that the customers live in
+COUNTRIES = [('US', 'United States', 80), ('CA', 'Canada', 8), ('GB', 'United Kingdom', 5),
+             ('DE', 'Germany', 3), ('FR', 'France', 2), ('AU', 'Australia', 2)]
+VENDOR_WORDS = ['Supply', 'Hobby', 'Metal', 'Wood', 'Craft', 'Shipping', 'Tool', 'Paper',
+                'Print', 'Parts']
+VENDOR_ENDS = ['Co.', 'Inc.', 'LLC', 'Ltd.', 'and Sons', 'Warehouse']
+# (title, price) of the things that are sold. Some of the titles have the characters
+# that have to be quoted in a CSV file.
+ITEMS = [('Brass Hinge, small', 4.50), ('Brass Hinge, large', 6.75), ('12" Steel Ruler', 9.95),
+         ('Walnut Box Kit', 39.00), ('Finishing Oil - 8 oz', 14.25), ('Carving Knife Set', 64.50),
+         ('"Premium" Sandpaper Pack', 11.00), ('Dovetail Jig', 129.99), ('Workbench Plans (PDF)', 18.00),
+         ('Hand Plane, No. 4', 185.00)]
+SUPPLIES = ['Raw materials', 'Packaging, boxes and tape', 'Postage', 'Shop supplies',
+            'Hardware order', 'Subscription']
+NOTES = ['Please ship quickly.', 'Gift - no invoice in the box, please.',
+         'Leave at the side door.\nThe front porch is being painted.',
+         'Same as the last order, "as before".']
+
+class PayPalGenerator(object):
+    '''
+    Make the lines of a PayPal CSV file. Credits are payments from customers and
+    debits are payments to vendors. A few customers account for most of the sales,
+    the way that repeat customers do. Duplicates are exact copies of lines that were
+    written recently, like the overlap between two exports of the same account.
+    '''
+
+    def __init__(self, rows=10000, customers=1000, vendors=50, duplicates=0.01, credit=0.8, seed=1):
+        self.rows = rows
+        self.duplicates = duplicates
+        self.credit = credit
+        self.random = random.Random(seed)
+        self.customers = [self.make_customer(x) for x in range(max(customers, 1))]
+        self.vendors = [self.make_vendor(x) for x in range(max(vendors, 1))]
+        self.time = datetime.datetime(2020, 1, 1, 8, 0, 0)
+        self.balance = 1000.0
+        self.serial = 0
+        # lines that a duplicate can be copied from
+        self.recent = deque(maxlen=1000)
+        self.counts = {'rows': 0, 'credits': 0, 'debits': 0, 'duplicates': 0, 'bytes': 0}
+
+    def make_customer(self, num):
+        r = self.random
+        first = r.choice(FIRST_NAMES)
+        last = r.choice(LAST_NAMES)
+        city, state = r.choice(CITIES)
+        code, country = r.choices([(c, n) for c, n, w in COUNTRIES], [w for c, n, w in COUNTRIES])[0]
+        return {
+            # the number keeps the names unique when there are more customers than names
+            'Name': '%s %s %d'%(first, last, num),
+            'FromEmail': '%s.%s%d@example.com'%(first.lower(), last.lower().replace("'", ''), num),
+            'AddressLine1': '%d %s'%(r.randrange(1, 9999), r.choice(STREETS)),
+            'AddressLine2': r.choice(['', '', '', 'Apt %d'%(r.randrange(1, 300))]),
+            'City': city,
+            'State': state,
+            'PostalCode': '%05d'%(r.randrange(1000, 99999)),
+            'Country': country,
+            'CountryCode': code,
+            'Phone': r.choice(['', '555-%03d-%04d'%(r.randrange(1000), r.randrange(10000))])}
+
+    def make_vendor(self, num):
+        r = self.random
+        name = '%s %s %s %d'%(r.choice(LAST_NAMES), r.choice(VENDOR_WORDS), r.choice(VENDOR_ENDS), num)
+        return {
+            'Name': name,
+            'ToEmail': 'sales%d@%s.example.com'%(num, name.split()[0].lower().replace("'", ''))}
+
+    def pick(self, people):
+        '''
+        Pick someone from the list with the ones at the start picked most often.
+        '''
+        return people[int(len(people) * self.random.random() ** 2)]
+
+    def amount(self, val):
+        return '{:,.2f}'.format(val)
+
+    def transaction_id(self):
+        '''
+        Return a new 17 character ID. Multiplying by an odd number is one to one in the
+        68 bits of the ID, so the IDs are unique and do not look like a counter.
+        '''
+        self.serial += 1
+        return '%017X'%((self.serial * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFFF)
+
+    def make_row(self):
+        r = self.random
+        self.time += datetime.timedelta(seconds=r.randrange(1, 600))
+        row = dict.fromkeys(LEGEND, '')
+        row.update({
+            'Date': self.time.strftime('%m/%d/%Y'),
+            'Time': self.time.strftime('%H:%M:%S'),
+            'TimeZone': 'PST',
+            'Status': 'Completed',
+            'Currency': 'USD',
+            'TransactionID': self.transaction_id(),
+            'InsuranceAmount': '0.00'})
+
+        if r.random() < self.credit:
+            cust = self.pick(self.customers)
+            item = r.randrange(len(ITEMS))
+            title, price = ITEMS[item]
+            qty = r.choice([1, 1, 1, 2, 3])
+            shipping = r.choice([0.0, 4.95, 7.50, 12.00])
+            tax = 0.0
+            if cust['State'] == 'IL':
+                tax = round(price * qty * 0.0625, 2)
+            gross = price * qty + shipping + tax
+            fee = -round(gross * 0.029 + 0.30, 2)
+            row.update(cust)
+            row.update({
+                'Type': r.choices(['Website Payment', 'General Payment'], [9, 1])[0],
+                'Gross': self.amount(gross),
+                'Fee': self.amount(fee),
+                'Net': self.amount(gross + fee),
+                'ToEmail': 'shop@example.com',
+                'ShippingAddress': '%s, %s, %s %s'%(cust['AddressLine1'], cust['City'], cust['State'], cust['PostalCode']),
+                'AddressStatus': 'Confirmed',
+                'ItemTitle': title,
+                'ItemID': 'ITEM-%03d'%(item),
+                'Shipping': self.amount(shipping),
+                'SalesTax': self.amount(tax),
+                'Quantity': str(qty),
+                'Subject': title,
+                'Note': r.choices(['', r.choice(NOTES)], [19, 1])[0],
+                'BalanceImpact': 'Credit'})
+            self.counts['credits'] += 1
+        else:
+            vend = self.pick(self.vendors)
+            gross = -round(r.uniform(5, 1500), 2)
+            row.update({
+                'Name': vend['Name'],
+                'Type': r.choice(['Express Checkout Payment', 'PreApproved Payment Bill User Payment']),
+                'Gross': self.amount(gross),
+                'Fee': '0.00',
+                'Net': self.amount(gross),
+                'FromEmail': 'shop@example.com',
+                'ToEmail': vend['ToEmail'],
+                'ItemTitle': r.choice(SUPPLIES),
+                'Shipping': '0.00',
+                'SalesTax': '0.00',
+                'Quantity': '1',
+                'Subject': 'Order %d'%(r.randrange(100000, 999999)),
+                'BalanceImpact': 'Debit'})
+            self.counts['debits'] += 1
+
+        self.balance += to_float(row['Net'])
+        row['Balance'] = self.amount(self.balance)
+        return [row[key] for key in LEGEND]
+
+    def write(self, fname):
+        '''
+        Write the file and return the counts of what was written.
+        '''
+        with open(fname, 'w', newline='') as fh:
+            writer = csv.writer(fh, quoting=csv.QUOTE_ALL)
+            writer.writerow(HEADER)
+            for x in range(self.rows):
+                if len(self.recent) > 0 and self.random.random() < self.duplicates:
+                    line = self.random.choice(self.recent)
+                    self.counts['duplicates'] += 1
+                else:
+                    line = self.make_row()
+                    self.recent.append(line)
+                writer.writerow(line)
+            self.counts['rows'] = self.rows
+            self.counts['bytes'] = fh.tell()
+
+        return self.counts
+
+def to_float(val):
+    '''
+    Convert an amount that was formatted by the generator back to a float.
+    '''
+    return float(val.replace(',', ''))
+
+def add_arguments(parser):
+    '''
+    Add the options that control what is in the file to an argument parser.
+    '''
+    parser.add_argument('--customers', type=int, default=1000, help='number of different customers')
+    parser.add_argument('--vendors', type=int, default=50, help='number of different vendors')
+    parser.add_argument('--duplicates', type=float, default=0.01, help='fraction of lines that repeat an earlier line')
+    parser.add_argument('--credit', type=float, default=0.8, help='fraction of transactions that are credits')
+    parser.add_argument('--seed', type=int, default=1, help='seed for the random numbers')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Make a PayPal CSV file of made up transactions.')
+    parser.add_argument('fname', help='name of the file to write')
+    parser.add_argument('--rows', type=int, default=10000, help='number of lines to write')
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    gen = PayPalGenerator(args.rows, args.customers, args.vendors, args.duplicates, args.credit, args.seed)
+    counts = gen.write(args.fname)
+    print('%d lines (%d credits, %d debits, %d duplicates), %d bytes'%(
+        counts['rows'], counts['credits'], counts['debits'], counts['duplicates'], counts['bytes']))
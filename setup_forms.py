@@ -1,14 +1,15 @@
 
-import sys
+import sys, os
 
 import tkinter as tk
 import tkinter.ttk as ttk
 from tkinter.messagebox import showerror, showinfo, askyesno
-from utility import Logger, debugger
+from utility import Logger, get_logger, debugger
 from database import Database
 from forms import Form
 from custom_widgets import *
 from importer import ImportPayPal
+from workers import WorkerPool, TaskCancelled
 
 
 class supplimental_form(Form):
@@ -44,20 +45,23 @@ class supplimental_form(Form):
             self.col += 1
 
         def getter():
-            return self.data.get_single_value(self.table, local_col, self.row_list[self.row_index])
+            if self.record is None:
+                return None
+            return self.record[local_col]
 
-
-        def setter(row_id):
-            # The 's' parameter is what is read from the data base, which will be an int.
-            val = self.data.get_single_value(table, indir_col, row_id)
+        def setter(val):
+            # The value comes from the joined table when the record is read.
             value.set(str(val))
 
         def clear(self):
             pass
 
+        alias = 'j_%s'%(local_col)
         self.controls[name] = {'column': local_col,
                                'table': table,
                                'ind_col': indir_col,
+                               'view': ('%s.%s'%(alias, indir_col),
+                                        'LEFT JOIN %s %s ON %s.ID = t.%s'%(table, alias, alias, local_col)),
                                'obj':lab,
                                'get':getter,
                                'set':lambda s: setter(s),
@@ -83,11 +87,12 @@ class supplimental_form(Form):
         def getter():
             pass
 
-        def setter(s):
-            # The 's' parameter is what is read from the data base, which will be an int.
-            val = self.data.get_single_value(self.table, 'committed', s)
-            if val:
+        def setter(committed):
+            # The parameter is the 'committed' column of the record.
+            if committed:
                 btn.configure(state='disabled')
+            else:
+                btn.configure(state='normal')
 
         def clear(self):
             pass
@@ -106,8 +111,8 @@ class supplimental_form(Form):
         '''
         self.logger.debug('Commit btn')
         self.controls['Commit']['obj'].configure(state='disabled')
-        self.data.set_single_value(self.table, 'committed', self.row_list[self.row_index], 1)
-        self.data.commit()
+        with self.data.transaction():
+            self.data.set_single_value(self.table, 'committed', self.row_id, 1)
 
     @debugger
     def add_products_widget(self):
@@ -116,8 +121,8 @@ class supplimental_form(Form):
         sales field. This is stored using a "one to many" connector table. The products listed
         must already exist in the database.
         '''
-        if len(self.row_list) > 0:
-            sale_id = self.row_list[self.row_index]
+        if not self.row_id is None:
+            sale_id = self.row_id
         else:
             sale_id = -1
 
@@ -134,16 +139,24 @@ class supplimental_form(Form):
         def getter():
             return wid.get()
 
-        def setter(sale_id):
-            wid.set(sale_id)
+        def setter(sale_id, products):
+            # The products are read with the record as "inventory_ID:quantity,..."
+            lst = []
+            if not products is None:
+                for item in products.split(','):
+                    inv, quan = item.split(':')
+                    lst.append((int(inv), int(quan)))
+            wid.set(sale_id, lst)
 
         def clear():
             pass
 
         self.controls['Products'] = {'column': None,
+                               'view': ('''(SELECT group_concat(x) FROM (SELECT p.inventory_ID || ':' || p.quantity AS x
+                                        FROM ProductList p WHERE p.sale_record_ID = t.ID ORDER BY p.ID))''', None),
                                'obj':wid,
                                'get':getter,
-                               'set':lambda s: setter(s),
+                               'set':setter,
                                'clear':clear,
                                'kind':self.PRODUCT}
 
@@ -180,12 +193,18 @@ class supplimental_form(Form):
     @debugger
     def add_import_btn(self):
         '''
+        Add the import button and the panel that shows the progress of the import.
         '''
         btn = tk.Button(self.btn_frame, text='Import', command=self.import_btn, width=self.btn_width)
         #btn.pack(padx=self.btn_padx, pady=self.btn_pady, side=tk.TOP)
         btn.grid(row = self.btn_row, column=0, padx=self.btn_padx, pady=self.btn_pady)
         self.btn_row += 1
 
+        self.import_task = None
+        self.progress = ProgressPanel(self.ctl_frame, command=self.import_cancel, bd=1, relief=tk.RIDGE)
+        self.progress.grid(row=self.row, column=1, padx=self.padx, pady=self.pady, sticky=tk.W)
+        self.row += 1
+
         def getter():
             pass
 
@@ -212,9 +231,45 @@ class supplimental_form(Form):
         if fname == '':
             showerror('Error', 'Please select a file instead of a directory')
         elif askyesno('Confirm Import', 'You are importing the file\n%s\nConfirm?'%(fname)):
-            self.logger.debug('Importing file: %s'%(fname))
-            importer = ImportPayPal(fname)
-            importer.import_all()
+            self.logger.debug('Importing file: %s', fname)
+            self.controls['Commit']['obj'].configure(state='disabled')
+            self.progress.start('Importing %s'%(os.path.basename(fname)))
+            self.import_task = WorkerPool.get_instance().submit(
+                                    lambda task, data: ImportPayPal(fname, data, task).import_all(),
+                                    done=self.import_done, error=self.import_error,
+                                    progress=self.progress.update_progress)
+
+    @debugger
+    def import_cancel(self):
+        '''
+        Called by the Cancel button of the progress panel.
+        '''
+        if not self.import_task is None:
+            self.import_task.cancel()
+
+    @debugger
+    def import_done(self, text):
+        '''
+        Called when the import has finished.
+        '''
+        self.import_task = None
+        self.controls['Commit']['obj'].configure(state='normal')
+        self.progress.finish('Import finished')
+        showinfo('Import', text)
+
+    @debugger
+    def import_error(self, exc):
+        '''
+        Called when the import has failed or was cancelled. The lines that were read
+        are kept, and importing the file again carries on from there.
+        '''
+        self.import_task = None
+        self.controls['Commit']['obj'].configure(state='normal')
+        if isinstance(exc, TaskCancelled):
+            self.progress.finish('Import cancelled')
+        else:
+            self.progress.finish('Import failed')
+            showerror('Import', 'The import failed:\n%s'%(str(exc)))
 
 
 class SetupBusinessForm(Form):
@@ -223,7 +278,7 @@ class SetupBusinessForm(Form):
     '''
 
     def __init__(self, notebook):
-        self.logger = Logger(self, Logger.DEBUG)
+        self.logger = get_logger(self)
         self.logger.debug(sys._getframe().f_code.co_name)
         super().__init__(notebook, notebook.BUSINESS_FRAME, 'Business')
 
@@ -252,9 +307,10 @@ class SetupBusinessForm(Form):
 class SetupCustomersForm(Form):
 
     def __init__(self, notebook):
-        self.logger = Logger(self, Logger.DEBUG)
+        self.logger = get_logger(self)
         self.logger.debug(sys._getframe().f_code.co_name)
         super().__init__(notebook, notebook.CUSTOMERS_FRAME, 'Customer')
+        self.browse_columns = ['name', 'city', 'state', 'email_address', 'phone_number']
 
         self.add_title('Customers Setup Form')
         self.add_dynamic_label('Date', 'date_created', width=20)
@@ -281,6 +337,7 @@ class SetupCustomersForm(Form):
 
         self.add_text('Notes', 'notes', height=10)
 
+        self.add_button('Browse')
         self.add_button('Prev')
         self.add_button('Next')
         self.add_button('Select')
@@ -291,9 +348,10 @@ class SetupCustomersForm(Form):
 class SetupVendorsForm(Form):
 
     def __init__(self, notebook):
-        self.logger = Logger(self, Logger.DEBUG)
+        self.logger = get_logger(self)
         self.logger.debug(sys._getframe().f_code.co_name)
         super().__init__(notebook, notebook.VENDORS_FRAME, 'Vendor')
+        self.browse_columns = ['name', 'contact_name', 'email_address', 'phone_number']
 
         self.add_title('Vendors Setup Form')
         self.add_dynamic_label('Date', 'date_created', width=20)
@@ -312,6 +370,7 @@ class SetupVendorsForm(Form):
 
         self.add_text('Notes', 'notes', height=10)
 
+        self.add_button('Browse')
         self.add_button('Prev')
         self.add_button('Next')
         self.add_button('Select')
@@ -322,7 +381,7 @@ class SetupVendorsForm(Form):
 class SetupAccountsForm(Form):
 
     def __init__(self, notebook):
-        self.logger = Logger(self, Logger.DEBUG)
+        self.logger = get_logger(self)
         self.logger.debug(sys._getframe().f_code.co_name)
         super().__init__(notebook, notebook.ACCOUNTS_FRAME, 'Account')
 
@@ -344,9 +403,10 @@ class SetupAccountsForm(Form):
 class SetupInventoryForm(Form):
 
     def __init__(self, notebook):
-        self.logger = Logger(self, Logger.DEBUG)
+        self.logger = get_logger(self)
         self.logger.debug(sys._getframe().f_code.co_name)
         super().__init__(notebook, notebook.INVENTORY_FRAME, 'InventoryItem')
+        self.browse_columns = ['name', 'stock_num', 'num_stock', 'retail', 'wholesale']
 
         self.add_title('Inventory Setup Form')
         self.add_entry('Name', 'name', str, width=20)
@@ -357,6 +417,7 @@ class SetupInventoryForm(Form):
         self.add_entry('Description', 'description', str)
         self.add_text('Notes', 'notes', height=10)
 
+        self.add_button('Browse')
         self.add_button('Prev')
         self.add_button('Next')
         self.add_button('Select')
@@ -368,9 +429,10 @@ class SetupInventoryForm(Form):
 class SetupSalesForm(supplimental_form):
 
     def __init__(self, notebook):
-        self.logger = Logger(self, Logger.DEBUG)
+        self.logger = get_logger(self)
         self.logger.debug(sys._getframe().f_code.co_name)
         super().__init__(notebook, notebook.SALES_FRAME, 'SaleRecord')
+        self.browse_columns = ['date', 'transaction_uuid', 'gross', 'fees', 'shipping']
 
         self.add_title('Sales Setup Form')
         self.add_indirect_label('Customer', 'customer_ID', 'Customer', 'name')
@@ -382,6 +444,7 @@ class SetupSalesForm(supplimental_form):
         self.add_products_widget()
         self.add_text('Notes', 'notes', height=10)
 
+        self.add_button('Browse')
         self.add_button('Prev')
         self.add_button('Next')
         self.add_button('Save')
@@ -393,26 +456,30 @@ class SetupSalesForm(supplimental_form):
     def save_callback(self):
         self.logger.debug('supplimental form save callback')
         if askyesno('Save record?', 'Are you sure you want to save this?'):
-            self.commit_form()
-            self.controls['Products']['obj'].save_btn()
-            self.data.commit()
+            # the record and its products are saved together
+            with self.data.transaction():
+                self.commit_form()
+                # a new record only has an ID once it has been inserted
+                self.controls['Products']['obj'].sale_id = self.row_id
+                self.controls['Products']['obj'].save_btn()
 
     @debugger
     def delete_callback(self):
         self.logger.debug('supplimental form delete callback')
         if askyesno('Delete record?', 'Are you sure you want to delete this?'):
-            self.data.delete_row(self.table, self.row_list[self.row_index])
-            self.data.delete_where('ProductList', 'sale_record_ID=%d'%(self.controls['Products']['obj'].sale_id))
-            self.row_list = self.data.get_id_list(self.table)
-            self.load_form()
-            self.data.commit()
+            if not self.new_record:
+                with self.data.transaction():
+                    self.data.delete_row(self.table, self.row_id)
+                    self.data.delete_where('ProductList', 'sale_record_ID=?', (self.controls['Products']['obj'].sale_id,))
+            self.remove_row()
 
 class SetupPurchaseForm(supplimental_form):
 
     def __init__(self, notebook):
-        self.logger = Logger(self, Logger.DEBUG)
+        self.logger = get_logger(self)
         self.logger.debug(sys._getframe().f_code.co_name)
         super().__init__(notebook, notebook.PURCHASE_FRAME, 'PurchaseRecord')
+        self.browse_columns = ['date', 'transaction_uuid', 'gross', 'tax', 'shipping']
 
         self.add_title('Purchase Setup Form')
         self.add_indirect_label('Vendor', 'vendor_ID', 'Vendor', 'name')
@@ -423,6 +490,7 @@ class SetupPurchaseForm(supplimental_form):
         self.add_combo('Purchase Status', 'PurchaseStatus', 'status_ID', width=20)
         self.add_text('Notes', 'notes', height=10)
 
+        self.add_button('Browse')
         self.add_button('Prev')
         self.add_button('Next')
         self.add_button('Save')
@@ -432,7 +500,7 @@ class SetupPurchaseForm(supplimental_form):
 class SetupImportForm(supplimental_form):
 
     def __init__(self, notebook):
-        self.logger = Logger(self, Logger.DEBUG)
+        self.logger = get_logger(self)
         self.logger.debug(sys._getframe().f_code.co_name)
         super().__init__(notebook, notebook.IMPORT_FRAME, 'RawImport')
 
@@ -1,6 +1,6 @@
 
 from notebook import NotebookBase
-from utility import Logger, debugger
+from utility import Logger, get_logger, debugger
 from setup_forms import *
 
 class SetupNotebook(NotebookBase):
@@ -15,18 +15,18 @@ class SetupNotebook(NotebookBase):
     IMPORT_FRAME = 7
 
     def __init__(self, master):
-        self.logger = Logger(self, level=Logger.DEBUG)
+        self.logger = get_logger(self)
         self.logger.debug(sys._getframe().f_code.co_name)
         super().__init__(master, ['Business', 'Customers', 'Vendors', 'Accounts',
                                   'Inventory', 'Sales', 'Purchase', 'Import'])
 
-        SetupBusinessForm(self)
-        SetupCustomersForm(self)
-        SetupVendorsForm(self)
-        SetupAccountsForm(self)
-        SetupInventoryForm(self)
-        SetupSalesForm(self)
-        SetupPurchaseForm(self)
-        SetupImportForm(self)
+        self.register_form(self.BUSINESS_FRAME, SetupBusinessForm)
+        self.register_form(self.CUSTOMERS_FRAME, SetupCustomersForm)
+        self.register_form(self.VENDORS_FRAME, SetupVendorsForm)
+        self.register_form(self.ACCOUNTS_FRAME, SetupAccountsForm)
+        self.register_form(self.INVENTORY_FRAME, SetupInventoryForm)
+        self.register_form(self.SALES_FRAME, SetupSalesForm)
+        self.register_form(self.PURCHASE_FRAME, SetupPurchaseForm)
+        self.register_form(self.IMPORT_FRAME, SetupImportForm)
 
         self.show_frame(self.BUSINESS_FRAME)
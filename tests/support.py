@@ -0,0 +1,51 @@
+'''
+Things that the tests share. The modules of the program are in the directory above
+this one. The tests that use a database run in a temporary directory that has a copy
+of the SQL files that the database is made from.
+'''
+import sys, os, shutil, tempfile, locale, unittest
+
+TOP = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if not TOP in sys.path:
+    sys.path.insert(0, TOP)
+
+import utility
+from utility import Logger
+from database import Database
+
+# the debug messages would bury the test results
+if not 'ACCOUNTING_LOG' in os.environ:
+    utility.LOG_LEVELS['default'] = Logger.WARNING
+# the test runner may close the stream that the log was given when it was made
+utility.LogSink.get_instance().stream = sys.__stderr__
+
+class DatabaseTest(unittest.TestCase):
+    '''
+    Each test gets a new database. A worker Database object is used because the
+    singleton cannot be made again.
+    '''
+
+    def setUp(self):
+        try:
+            locale.setlocale(locale.LC_ALL, 'en_US.UTF-8')
+        except locale.Error:
+            raise unittest.SkipTest('the en_US.UTF-8 locale is not installed')
+
+        self.cwd = os.getcwd()
+        self.dir = tempfile.mkdtemp(prefix='accounting_test_')
+        for name in ['database.sql', 'populate.sql']:
+            shutil.copy(os.path.join(TOP, name), self.dir)
+        os.chdir(self.dir)
+        self.data = Database.worker_instance()
+
+    def tearDown(self):
+        self.data.close()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def reopen(self):
+        '''
+        Close the database and open it again.
+        '''
+        self.data.close()
+        self.data = Database.worker_instance()
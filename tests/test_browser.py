@@ -0,0 +1,57 @@
+import random
+import unittest
+from support import DatabaseTest
+from custom_widgets import RecordWindow
+
+class RecordWindowTest(DatabaseTest):
+
+    def setUp(self):
+        super().setUp()
+        r = random.Random(3)
+        self.data.execute('CREATE TABLE Item (ID INTEGER PRIMARY KEY, name TEXT);')
+        # repeated names and NULLs, so the ID has to break ties
+        names = [None, 'apple', 'pear', 'plum', 'fig', 'lime']
+        with self.data.transaction():
+            for x in range(500):
+                self.data.execute('INSERT INTO Item (name) VALUES (?);', (r.choice(names),))
+
+    def expected(self, window):
+        order = 'DESC' if window.desc else ''
+        if window.order_col == 'ID':
+            sql = 'SELECT ID FROM Item ORDER BY ID %s;'%(order)
+        else:
+            sql = 'SELECT ID FROM Item ORDER BY %s %s, ID %s;'%(window.order_col, order, order)
+        return [row[0] for row in self.data.execute(sql)]
+
+    def check(self, window, ids):
+        self.assertEqual([row['ID'] for row in window.rows], ids[window.top:window.top+window.size])
+
+    def test_moves(self):
+        r = random.Random(5)
+        window = RecordWindow(self.data, 'Item', ['name'], 25)
+        for order_col, desc in [('ID', False), ('ID', True), ('name', False), ('name', True)]:
+            window.order_col = order_col
+            window.desc = desc
+            window.refresh()
+            ids = self.expected(window)
+            self.check(window, ids)
+            for x in range(200):
+                # small steps are read by key and big ones by position
+                step = r.choice([1, -1, 3, -3, 24, -24, 25, -25, 300, -300])
+                window.move_to(window.top + step)
+                self.assertTrue(0 <= window.top <= 500 - 25)
+                self.check(window, ids)
+            window.move_to(10000)
+            self.assertEqual(window.top, 475)
+            self.check(window, ids)
+
+    def test_small_table(self):
+        self.data.execute('DELETE FROM Item WHERE ID > 10;')
+        window = RecordWindow(self.data, 'Item', ['name'], 25)
+        window.refresh()
+        self.assertEqual(len(window.rows), 10)
+        self.assertFalse(window.move_to(5))
+        self.assertEqual(window.top, 0)
+
+if __name__ == '__main__':
+    unittest.main()
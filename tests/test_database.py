@@ -0,0 +1,147 @@
+import os
+import sqlite3 as sql
+import unittest
+from unittest import mock
+from support import DatabaseTest
+from database import Database
+
+class Interrupted(Exception):
+    pass
+
+class TransactionTest(DatabaseTest):
+
+    def add(self, name):
+        self.data.execute("INSERT INTO Country (name, abbreviation) VALUES (?, 'XX');", (name,))
+
+    def names(self):
+        return [row[0] for row in self.data.execute("SELECT name FROM Country WHERE abbreviation = 'XX' ORDER BY ID;")]
+
+    def test_commit(self):
+        with self.data.transaction():
+            self.add('one')
+            with self.data.transaction():
+                self.add('two')
+        self.reopen()
+        self.assertEqual(self.names(), ['one', 'two'])
+
+    def test_inner_failure(self):
+        # only the inner block is rolled back
+        with self.data.transaction():
+            self.add('one')
+            with self.assertRaises(ValueError):
+                with self.data.transaction():
+                    self.add('two')
+                    raise ValueError('inner')
+            self.add('three')
+        self.reopen()
+        self.assertEqual(self.names(), ['one', 'three'])
+
+    def test_outer_failure(self):
+        with self.assertRaises(ValueError):
+            with self.data.transaction():
+                self.add('one')
+                with self.data.transaction():
+                    self.add('two')
+                raise ValueError('outer')
+        self.assertEqual(self.names(), [])
+        self.assertEqual(self.data.tx_depth, 0)
+
+    def test_inner_interrupt(self):
+        # SQLite rolls back the whole transaction when a write is interrupted, so the
+        # savepoint is gone. The error that is raised is the interrupt.
+        with self.assertRaises(sql.OperationalError) as cm:
+            with self.data.transaction():
+                self.add('one')
+                with self.data.transaction():
+                    self.data.set_progress_handler(lambda: True, 1)
+                    try:
+                        self.add('two')
+                    finally:
+                        self.data.set_progress_handler(None)
+        self.assertIn('interrupted', str(cm.exception))
+        self.assertEqual(self.data.tx_depth, 0)
+        self.assertFalse(self.data.db.in_transaction)
+        self.assertEqual(self.names(), [])
+
+        # the connection can still be used
+        with self.data.transaction():
+            self.add('four')
+        self.assertEqual(self.names(), ['four'])
+
+class MigrationTest(DatabaseTest):
+
+    def user_version(self):
+        return self.data.db.execute('PRAGMA user_version;').fetchone()[0]
+
+    def columns(self, table):
+        return [row[1] for row in self.data.db.execute('PRAGMA table_info(%s);'%(table))]
+
+    def test_interrupted_step(self):
+        # make the database again, stopping in the middle of the last step
+        self.data.close()
+        for name in os.listdir('.'):
+            if name.startswith('accounting.db'):
+                os.remove(name)
+
+        execute = Database.execute
+        def fail(data, stmt, params=()):
+            if stmt.startswith('ALTER TABLE ImportedFileNames ADD COLUMN size'):
+                raise Interrupted()
+            return execute(data, stmt, params)
+
+        with mock.patch.object(Database, 'execute', fail):
+            with self.assertRaises(Interrupted):
+                Database.worker_instance()
+
+        # nothing from the step was kept, and it is run again from the start
+        self.data = Database.worker_instance()
+        self.assertEqual(self.user_version(), len(self.data.migrations))
+        for col in ['hash', 'size', 'byte_offset', 'line_count', 'complete']:
+            self.assertIn(col, self.columns('ImportedFileNames'))
+
+    @unittest.skipIf(sql.sqlite_version_info < (3, 35, 0), 'DROP COLUMN needs SQLite 3.35')
+    def test_half_migrated(self):
+        # a database that an older version left with only the first column of step 1.4
+        for col in ['size', 'byte_offset', 'line_count', 'complete']:
+            self.data.execute('ALTER TABLE ImportedFileNames DROP COLUMN %s;'%(col))
+        step = [version for version, statements in self.data.migrations].index('1.4')
+        self.data.execute('PRAGMA user_version = %d;'%(step))
+        self.data.db.commit()
+
+        self.reopen()
+        self.assertEqual(self.user_version(), len(self.data.migrations))
+        self.assertEqual(self.columns('ImportedFileNames')[-5:], ['hash', 'size', 'byte_offset', 'line_count', 'complete'])
+
+    def test_newer_database(self):
+        self.data.db.execute('PRAGMA user_version = %d;'%(len(self.data.migrations) + 1))
+        self.reopen()
+        self.assertEqual(self.data.migrate(), 0)
+        self.assertEqual(self.user_version(), len(self.data.migrations) + 1)
+
+    def test_data_version(self):
+        self.assertEqual(self.data.data_version, self.data.migrations[-1][0])
+
+class SearchIndexTest(DatabaseTest):
+
+    def setUp(self):
+        super().setUp()
+        if not self.data.has_fts5():
+            raise unittest.SkipTest('SQLite does not have FTS5')
+
+    def test_rebuilt_when_missing(self):
+        # as if the migration ran on a SQLite library without FTS5
+        for row in self.data.db.execute("SELECT name FROM sqlite_master WHERE type='trigger' AND name LIKE '%_search_%';").fetchall():
+            self.data.execute('DROP TRIGGER %s;'%(row[0]))
+        self.data.execute('DROP TABLE SearchIndex;')
+        self.data.execute("INSERT INTO Customer (name, class_ID) VALUES ('Stoneworks Supply', 1);")
+        self.data.db.commit()
+
+        self.reopen()
+        self.assertTrue(self.data.fts_index)
+        self.assertEqual([hit['title'] for hit in self.data.search('stone')], ['Stoneworks Supply'])
+        # and the triggers keep it up to date
+        self.data.execute("INSERT INTO Customer (name, class_ID) VALUES ('Stonehenge Tours', 1);")
+        self.assertEqual(len(self.data.search('stone')), 2)
+
+if __name__ == '__main__':
+    unittest.main()
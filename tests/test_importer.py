@@ -0,0 +1,202 @@
+import os, csv
+import unittest
+from support import DatabaseTest
+from importer import ImportPayPal, LEGEND
+from paypal_gen import PayPalGenerator
+from workers import Task, TaskCancelled
+
+class CancelAt(Task):
+    '''
+    A task that cancels itself when the import reports progress for the given stage
+    for the given number of times.
+    '''
+
+    def __init__(self, stage, reports=1):
+        super().__init__(None, None, (), {})
+        self.stage = stage
+        self.reports = reports
+
+    def report(self, stage, index, count, rows, rate, fraction):
+        if index == self.stage:
+            self.reports -= 1
+            if self.reports <= 0:
+                self.cancel()
+
+class ImportTest(DatabaseTest):
+
+    def make_file(self, name, rows, duplicates=0.0, seed=1):
+        '''
+        Write a generated PayPal file and return its name and its records.
+        '''
+        fname = os.path.join(self.dir, name)
+        PayPalGenerator(rows, 50, 10, duplicates, 0.8, seed).write(fname)
+        return fname, self.read_records(fname)
+
+    def read_records(self, fname):
+        with open(fname, newline='') as fh:
+            return list(csv.reader(fh))[1:]
+
+    def write_records(self, fname, header, records):
+        with open(fname, 'w', newline='') as fh:
+            writer = csv.writer(fh, quoting=csv.QUOTE_ALL)
+            writer.writerow(header)
+            for rec in records:
+                writer.writerow(rec)
+
+    def importer(self, fname, task=None, parallel=False):
+        imp = ImportPayPal(fname, self.data, task)
+        # small pieces so that a file of a few hundred lines is read in many of them
+        imp.parse_bytes = 16*1024
+        if parallel:
+            imp.processes = 2
+            imp.parallel_size = 0
+        else:
+            imp.processes = 1
+        return imp
+
+    def stored_ids(self):
+        return [row[0] for row in self.data.execute('SELECT TransactionID FROM RawImport ORDER BY ID;')]
+
+    def unique_ids(self, records):
+        '''
+        The TransactionIDs in the order that they are first seen.
+        '''
+        tid = LEGEND.index('TransactionID')
+        retv = []
+        seen = set()
+        for rec in records:
+            if not rec[tid] in seen:
+                seen.add(rec[tid])
+                retv.append(rec[tid])
+        return retv
+
+class BlankLineTest(ImportTest):
+
+    def blank_lines(self, parallel):
+        fname, records = self.make_file('paypal.csv', 400)
+        with open(fname, newline='') as fh:
+            header = next(csv.reader(fh))
+        # a blank line after the header, one in the middle and two at the end
+        self.write_records(fname, header, [[]] + records[:200] + [[]] + records[200:] + [[], []])
+
+        imp = self.importer(fname, parallel=parallel)
+        imp.import_all()
+        self.assertEqual(imp.accepted, 400)
+        self.assertEqual(imp.rejected, 0)
+        self.assertEqual(self.stored_ids(), self.unique_ids(records))
+
+    def test_serial(self):
+        self.blank_lines(False)
+
+    def test_parallel(self):
+        self.blank_lines(True)
+
+class ResumeTest(ImportTest):
+
+    def file_row(self):
+        return self.data.get_single_row('SELECT * FROM ImportedFileNames;')
+
+    def test_resume_after_cancel(self):
+        fname, records = self.make_file('paypal.csv', 600, 0.05)
+        expected = self.unique_ids(records)
+
+        # stopped part of the way through reading the file
+        with self.assertRaises(TaskCancelled):
+            self.importer(fname, CancelAt(0, 5)).import_all()
+        row = self.file_row()
+        self.assertFalse(row['complete'])
+        self.assertLess(0, row['byte_offset'])
+        self.assertLess(row['byte_offset'], os.path.getsize(fname))
+        # what was kept is the start of the file, up to the last checkpoint
+        stored = self.stored_ids()
+        self.assertGreater(len(stored), 0)
+        self.assertEqual(stored, expected[:len(stored)])
+        self.assertEqual(self.data.get_count('SaleRecord'), 0)
+
+        imp = self.importer(fname)
+        text = imp.import_all()
+        self.assertIn('continued from line %d'%(row['line_count'] + 1), text)
+        self.assertEqual(self.stored_ids(), expected)
+        self.assertEqual(imp.accepted + len(stored), len(expected))
+        self.assertTrue(self.file_row()['complete'])
+        self.assertGreater(self.data.get_count('SaleRecord'), 0)
+
+    def test_resume_stages(self):
+        fname, records = self.make_file('paypal.csv', 600, 0.05)
+        expected = self.unique_ids(records)
+
+        # the file was read, but the import stopped in the Customers stage
+        with self.assertRaises(TaskCancelled):
+            self.importer(fname, CancelAt(2)).import_all()
+        row = self.file_row()
+        self.assertFalse(row['complete'])
+        self.assertEqual(row['byte_offset'], os.path.getsize(fname))
+        self.assertEqual(self.data.get_count('Customer'), 0)
+        self.assertEqual(self.data.get_count('SaleRecord'), 0)
+
+        imp = self.importer(fname)
+        text = imp.import_all()
+        self.assertNotIn('continued from line', text)
+        self.assertIn('read in full before', text)
+        self.assertEqual(imp.accepted, 0)
+        self.assertEqual(self.stored_ids(), expected)
+        self.assertTrue(self.file_row()['complete'])
+        self.assertGreater(self.data.get_count('Customer'), 0)
+        self.assertGreater(self.data.get_count('SaleRecord'), 0)
+
+    def test_reimport(self):
+        fname, records = self.make_file('paypal.csv', 300, 0.05)
+        self.importer(fname).import_all()
+        counts = [self.data.get_count(table) for table in ['RawImport', 'Customer', 'Vendor', 'SaleRecord', 'PurchaseRecord']]
+
+        # the same contents under another name are found by the hash
+        other = os.path.join(self.dir, 'again.csv')
+        with open(fname, 'rb') as src, open(other, 'wb') as dst:
+            dst.write(src.read())
+        for name in [fname, other]:
+            imp = self.importer(name)
+            text = imp.import_all()
+            self.assertIn('already imported', text)
+            self.assertEqual(imp.accepted, 0)
+            self.assertEqual(counts, [self.data.get_count(table) for table in ['RawImport', 'Customer', 'Vendor', 'SaleRecord', 'PurchaseRecord']])
+
+class OverlapTest(ImportTest):
+    '''
+    Two exports of the same account that share some of their lines.
+    '''
+
+    def overlap(self, bloom):
+        fname, records = self.make_file('all.csv', 900, 0.02)
+        with open(fname, newline='') as fh:
+            header = next(csv.reader(fh))
+        first = os.path.join(self.dir, 'first.csv')
+        second = os.path.join(self.dir, 'second.csv')
+        # each ends with a short line that has no TransactionID
+        self.write_records(first, header, records[:600] + [['01/02/2020', '10:00:00']])
+        self.write_records(second, header, records[300:] + [['01/02/2020', '10:00:00']])
+
+        accepted = 0
+        for name in [first, second]:
+            imp = self.importer(name)
+            if bloom:
+                imp.bloom_size = 0
+            text = imp.import_all()
+            self.assertEqual(bloom, 'Bloom filter' in text)
+            self.assertIn('1 lines without a TransactionID were left out', text)
+            accepted += imp.accepted
+            self.assertEqual(imp.accepted + imp.rejected, len(self.read_records(name)))
+
+        expected = self.unique_ids(records)
+        self.assertEqual(self.stored_ids(), expected)
+        self.assertEqual(accepted, len(expected))
+        # the second import only promotes its new lines
+        self.assertEqual(self.data.get_count('SaleRecord'), self.data.get_count('RawImport', 'BalanceImpact = ?', ('Credit',)))
+
+    def test_set(self):
+        self.overlap(False)
+
+    def test_bloom(self):
+        self.overlap(True)
+
+if __name__ == '__main__':
+    unittest.main()
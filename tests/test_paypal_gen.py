@@ -0,0 +1,50 @@
+import os, csv, shutil, tempfile
+import unittest
+import support # puts the modules of the program on the path
+from importer import LEGEND
+from paypal_gen import PayPalGenerator, HEADER
+
+class GeneratorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix='accounting_test_')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def write(self, name, **kargs):
+        fname = os.path.join(self.dir, name)
+        counts = PayPalGenerator(**kargs).write(fname)
+        with open(fname, 'rb') as fh:
+            return counts, fh.read()
+
+    def test_same_seed(self):
+        first = self.write('a.csv', rows=500, seed=7)
+        self.assertEqual(first, self.write('b.csv', rows=500, seed=7))
+        self.assertNotEqual(first[1], self.write('c.csv', rows=500, seed=8)[1])
+
+    def test_contents(self):
+        counts, text = self.write('a.csv', rows=2000, customers=20, vendors=5, duplicates=0.1, credit=0.6)
+        with open(os.path.join(self.dir, 'a.csv'), newline='') as fh:
+            lines = list(csv.reader(fh))
+
+        self.assertEqual(lines[0], HEADER)
+        self.assertEqual(len(HEADER), len(LEGEND))
+        records = lines[1:]
+        self.assertEqual(len(records), 2000)
+        self.assertEqual(counts['bytes'], len(text))
+        for rec in records:
+            self.assertEqual(len(rec), len(LEGEND))
+
+        tid = LEGEND.index('TransactionID')
+        name = LEGEND.index('Name')
+        impact = LEGEND.index('BalanceImpact')
+        self.assertEqual(len(set([rec[tid] for rec in records])), 2000 - counts['duplicates'])
+        self.assertEqual(counts['credits'] + counts['debits'] + counts['duplicates'], 2000)
+        self.assertAlmostEqual(counts['duplicates'] / 2000, 0.1, delta=0.03)
+        self.assertAlmostEqual(counts['credits'] / (counts['credits'] + counts['debits']), 0.6, delta=0.05)
+        self.assertLessEqual(len(set([rec[name] for rec in records if rec[impact] == 'Credit'])), 20)
+        self.assertLessEqual(len(set([rec[name] for rec in records if rec[impact] == 'Debit'])), 5)
+
+if __name__ == '__main__':
+    unittest.main()
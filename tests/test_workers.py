@@ -0,0 +1,115 @@
+import time, threading
+import sqlite3 as sql
+import unittest
+from unittest import mock
+from support import DatabaseTest
+from database import Database
+from workers import WorkerPool, Task, TaskCancelled
+
+class Master(object):
+    '''
+    Stands in for the widget whose after() the pool uses. The calls are made when
+    the test runs the event loop.
+    '''
+
+    def __init__(self):
+        self.calls = []
+
+    def after(self, ms, func):
+        self.calls.append(func)
+        return len(self.calls)
+
+class WorkerPoolTest(DatabaseTest):
+
+    def setUp(self):
+        super().setUp()
+        self.master = Master()
+        self.pool = WorkerPool.get_instance()
+        self.pool.set_master(self.master)
+
+    def run_loop(self, timeout=10):
+        '''
+        Make the after() calls until the tasks have finished, the way that the
+        mainloop would.
+        '''
+        end = time.time() + timeout
+        while self.pool.active > 0:
+            self.assertLess(time.time(), end, 'the tasks did not finish')
+            calls, self.master.calls = self.master.calls, []
+            for func in calls:
+                func()
+            time.sleep(0.01)
+
+    def test_done(self):
+        results = []
+        threads = []
+        def done(result):
+            results.append(result)
+            threads.append(threading.current_thread())
+
+        self.pool.submit(lambda task, data, a, b: a + b, 2, 3, done=done, writes=False)
+        self.run_loop()
+        self.assertEqual(results, [5])
+        # the callback is run in the thread that runs the loop
+        self.assertEqual(threads, [threading.current_thread()])
+
+    def test_error(self):
+        errors = []
+        def fail(task, data):
+            raise ValueError('bad')
+
+        self.pool.submit(fail, error=errors.append, writes=False)
+        self.run_loop()
+        self.assertEqual([type(e) for e in errors], [ValueError])
+
+    def test_cancel(self):
+        started = threading.Event()
+        errors = []
+        def job(task, data):
+            started.set()
+            while True:
+                task.check()
+                time.sleep(0.01)
+
+        task = self.pool.submit(job, error=errors.append, writes=False)
+        self.assertTrue(started.wait(5))
+        task.cancel()
+        self.run_loop()
+        self.assertEqual([type(e) for e in errors], [TaskCancelled])
+
+    def test_progress(self):
+        # the reports that the loop has not taken are replaced by the latest one
+        reports = []
+        results = []
+        def job(task, data):
+            for x in range(1, 1001):
+                task.report('stage', x)
+            return 'done'
+
+        self.pool.submit(job, done=results.append, progress=lambda *args: reports.append(args), writes=False)
+        self.run_loop()
+        self.assertEqual(results, ['done'])
+        self.assertGreater(len(reports), 0)
+        self.assertLess(len(reports), 1000)
+        self.assertEqual(reports[-1], ('stage', 1000))
+
+    def test_no_connection(self):
+        # The workers of the pool may already have a connection, so the task is given
+        # to run_task() here, the way that a worker without one would run it.
+        errors = []
+        ran = []
+        def fail():
+            raise sql.OperationalError('database is locked')
+
+        task = Task(self.pool, lambda task, data: ran.append(data), (), {}, error=errors.append, writes=False)
+        self.pool.active += 1
+        with mock.patch.object(Database, 'worker_instance', fail):
+            self.assertIsNone(self.pool.run_task(task, None))
+        self.pool.schedule()
+        self.run_loop()
+        self.assertEqual(ran, [])
+        self.assertEqual([str(e) for e in errors], ['database is locked'])
+        self.assertEqual(self.pool.active, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,13 +1,125 @@
 
-import sys, math, time, pprint, pickle
-import traceback
+import sys, os, math, time, pprint, pickle
+import traceback, threading, queue, atexit
+from collections import deque, namedtuple
 from tkinter import messagebox as mbox
 import tkinter as tk
 
+# A log record. The time is from time.time() and func is the name of the function
+# that logged a debug message, or None for other levels.
+LogRecord = namedtuple('LogRecord', ['time', 'level', 'name', 'func', 'message'])
+
+class LogSink(object):
+    '''
+    All loggers send their records here. The records are written to the stream by a
+    background thread so that writing the log does not hold up the caller. The queue
+    to the thread is bounded. When it is full, records are not written, but they are
+    still kept in the ring buffer of the most recent records, which can be dumped
+    when something goes wrong.
+    '''
+
+    __instance = None
+
+    @staticmethod
+    def get_instance():
+        '''
+        This static method is used to get the singleton object for this class.
+        '''
+        if LogSink.__instance == None:
+            LogSink()
+        return LogSink.__instance
+
+    def __init__(self, stream=None, queue_size=10000, ring_size=2000):
+
+        # gate the access to __init__()
+        if LogSink.__instance != None:
+            raise Exception("LogSink class is a singleton. Use get_instance() instead.")
+        else:
+            LogSink.__instance = self
+
+        if stream is None:
+            self.stream = sys.stderr
+        else:
+            self.stream = stream
+
+        self.queue = queue.Queue(queue_size)
+        self.ring = deque(maxlen=ring_size)
+        self.dropped = 0
+
+        self.thread = threading.Thread(target=self.run, name='LogSink', daemon=True)
+        self.thread.start()
+        atexit.register(self.flush)
+
+    def put(self, record):
+        '''
+        Add a record to the ring buffer and queue it to be written.
+        '''
+        self.ring.append(record)
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def run(self):
+        '''
+        Writer thread. Takes records off of the queue and writes them to the stream.
+        '''
+        dropped = 0
+        while True:
+            record = self.queue.get()
+            if self.dropped != dropped:
+                self.stream.write("%d log records were not written because the log queue was full\n"%(self.dropped - dropped))
+                dropped = self.dropped
+            self.stream.write(self.format(record))
+            if self.queue.empty():
+                self.stream.flush()
+            self.queue.task_done()
+
+    def format(self, record):
+        '''
+        Return the text of a record as it is written to the stream.
+        '''
+        t = time.strftime("[%Y%m%d %H:%M:%S]", time.localtime(record.time))
+        if record.func is None:
+            return "%s %s: %s: %s\n"%(t, record.level, record.name, record.message)
+        else:
+            return "%s %s: %s.%s(): %s\n"%(t, record.level, record.name, record.func, record.message)
+
+    def flush(self, timeout=2.0):
+        '''
+        Wait for the writer thread to write everything that is in the queue.
+        '''
+        end = time.time() + timeout
+        while self.queue.unfinished_tasks > 0 and time.time() < end:
+            time.sleep(0.01)
+        self.stream.flush()
+
+    def get_recent(self):
+        '''
+        Return a list of the records in the ring buffer, oldest first.
+        '''
+        return list(self.ring)
+
+    def dump(self, stream=None):
+        '''
+        Write the records in the ring buffer to the stream. This is done directly,
+        not by the writer thread.
+        '''
+        self.flush()
+        if stream is None:
+            stream = self.stream
+        stream.write("---- last %d log records ----\n"%(len(self.ring)))
+        for record in self.get_recent():
+            stream.write(self.format(record))
+        stream.write("---- end of log records ----\n")
+        stream.flush()
+
 class Logger(object):
     '''
     Logger class produces messages on the text console. Used mostly for
     debugging. Supports individual class debugging and debug levels.
+
+    The messages are passed to the LogSink, which writes them in the background.
     '''
 
     DEBUG = 0
@@ -35,40 +147,43 @@ class Logger(object):
         self.level = []
         self.level.insert(0, level)
 
-        #if stream == self.STDERR:
-        self.stream = sys.stderr
-        #else:
-        #self.stream = sys.stdout
+        self.sink = LogSink.get_instance()
+
+    # The message can be a format string with the values to format passed after it,
+    # as in logger.debug("value = %s", value). The message is only formatted if it
+    # is actually written, so nothing is formatted for a level that is turned off.
+    def write(self, lev, args, fargs=(), func=None):
+        if len(fargs) > 0:
+            args = args % fargs
+        self.sink.put(LogRecord(time.time(), lev, self.name, func, args))
 
-    def fmt(self, args, lev):
-        t = time.strftime("[%Y%m%d %H:%M:%S]")
-        return "%s %s: %s: %s\n"%(t, lev, self.name, args)
+    def enabled(self, level):
+        return self.level[0] <= level
 
-    def debug(self, args, frame_num = 1):
+    def debug(self, args, *fargs, frame_num = 1):
         if self.level[0] <= self.dbg:
-            s1 = sys._getframe(frame_num).f_code.co_name
-            t = time.strftime("[%Y%m%d %H:%M:%S]")
-            self.stream.write("%s %s: %s.%s(): %s\n"%(t, "DEBUG", self.name, s1, args))
+            self.write('DEBUG', args, fargs, sys._getframe(frame_num).f_code.co_name)
 
-    def info(self, args):
+    def info(self, args, *fargs):
         if self.level[0] <= self.inf:
-            self.stream.write(self.fmt(args, 'INFO'))
+            self.write('INFO', args, fargs)
 
-    def warning(self, args):
+    def warning(self, args, *fargs):
         if self.level[0] <= self.warn:
-            self.stream.write(self.fmt(args, 'WARNING'))
+            self.write('WARNING', args, fargs)
 
-    def error(self, args):
+    def error(self, args, *fargs):
         if self.level[0] <= self.err:
-            self.stream.write(self.fmt(args, 'ERROR'))
+            self.write('ERROR', args, fargs)
 
-    def msg(self, args):
+    def msg(self, args, *fargs):
         if self.level[0] <= self.mess:
-            self.stream.write(self.fmt(args, 'MSG'))
+            self.write('MSG', args, fargs)
 
-    def fatal(self, args):
-        self.stream.write(self.fmt(args, 'FATAL ERROR'))
-        self.stream.write("System cannot continue\n\n")
+    def fatal(self, args, *fargs):
+        self.write('FATAL ERROR', args, fargs)
+        self.sink.dump()
+        self.sink.stream.write("System cannot continue\n\n")
         sys.exit(1)
 
     def push_level(self, level):
@@ -83,10 +198,61 @@ class Logger(object):
 
     def debugger(self, name, args):
         if self.level[0] <= self.dbg:
-            t = time.strftime("[%Y%m%d %H:%M:%S]")
-            self.stream.write("%s %s: %s.%s(): %s\n"%(t, "DEBUG", self.name, name, args))
+            self.write('DEBUG', args, func=name)
+
+# Logging level for each class that has a logger. Classes that are not listed use the
+# 'default' level. The levels can be changed without editing the code by setting
+# ACCOUNTING_LOG in the environment, as in ACCOUNTING_LOG="default=INFO,Database=DEBUG".
+LOG_LEVELS = {
+    'default': Logger.DEBUG,
+    'Utility': Logger.INFO,
+    'ScrollableFrame': Logger.INFO,
+}
+
+LEVEL_NAMES = {
+    'DEBUG': Logger.DEBUG,
+    'INFO': Logger.INFO,
+    'WARNING': Logger.WARNING,
+    'ERROR': Logger.ERROR,
+    'MESSAGE': Logger.MESSAGE,
+}
+
+# settings from ACCOUNTING_LOG that name a level that does not exist
+bad_log_levels = []
+for item in os.environ.get('ACCOUNTING_LOG', '').split(','):
+    if '=' in item:
+        name, level = item.split('=', 1)
+        if level.strip().upper() in LEVEL_NAMES:
+            LOG_LEVELS[name.strip()] = LEVEL_NAMES[level.strip().upper()]
+        else:
+            bad_log_levels.append(item.strip())
 
-logger = Logger("Utility", Logger.INFO)
+# The loggers that have been created, by class name.
+loggers = {}
+
+def get_logger(name):
+    '''
+    Return the shared Logger for a class. The name can be a string or an object, in
+    which case the name of its class is used. The logger is created the first time
+    it is asked for, with the level from LOG_LEVELS.
+    '''
+    if not type(name) == str:
+        name = name.__class__.__name__
+
+    retv = loggers.get(name)
+    if retv is None:
+        retv = Logger(name, LOG_LEVELS.get(name, LOG_LEVELS['default']))
+        loggers[name] = retv
+    return retv
+
+logger = get_logger("Utility")
+for item in bad_log_levels:
+    logger.warning("ACCOUNTING_LOG: unknown level in '%s', the default level is used", item)
+
+# The @debugger decorator is applied when a module is imported. If this is False at
+# that time, then the methods are not wrapped at all and tracing costs nothing. Set
+# ACCOUNTING_DEBUGGER=0 in the environment to turn it off.
+DEBUGGER_ENABLED = os.environ.get('ACCOUNTING_DEBUGGER', '1') != '0'
 
 def base_decorator(decorator):
     '''This decorator can be used to turn simple functions
@@ -118,16 +284,25 @@ def debugger(func):
     Debugger decorator places messages in the debug output when the class
     method is entered and when it is exited. It cannot be used with functions
     and it depends on the class having a "logger" member. When the logging
-    level is below DEBUG this function does nothing.
+    level is above DEBUG this only checks the level and calls the method. When
+    DEBUGGER_ENABLED is False the method is returned without being wrapped.
 
     This can only wrap a method in a class that has a logger.
     '''
+    if not DEBUGGER_ENABLED:
+        return func
+
+    name = func.__name__
     def wrapper(*args, **kwargs):
+        logger = args[0].logger
+        if logger.level[0] > Logger.DEBUG:
+            return func(*args, **kwargs)
+
         #try:
-        args[0].logger.debugger(func.__name__, "-- enter")
+        logger.debugger(name, "-- enter")
         #print(func.__name__, "-- enter")
         retv = func(*args, **kwargs)
-        args[0].logger.debugger(func.__name__, "-- returning: %s"%(str(retv)))
+        logger.debugger(name, "-- returning: %s"%(str(retv)))
         #print(func.__name__, "-- returning: %s"%(str(retv)))
         return retv
         #except Exception as ex:
@@ -0,0 +1,244 @@
+import sys, threading, queue, traceback
+from utility import Logger, get_logger, debugger
+from database import Database
+
+class TaskCancelled(Exception):
+    '''
+    Raised by Task.check() in the worker when the task has been cancelled.
+    '''
+    pass
+
+class Task(object):
+    '''
+    A function that runs in a worker thread. The function is called with the task,
+    the worker's Database object and the arguments that were given to submit(). It
+    must not touch any widgets. It can call report() to send progress to the GUI, and
+    it should call check() from time to time, which raises TaskCancelled if the task
+    has been cancelled.
+
+    These callbacks are run in the GUI thread:
+        done(result)    -- the function returned result
+        error(exc)      -- the function raised exc, which may be TaskCancelled
+        progress(*args) -- the latest arguments given to report()
+    '''
+
+    def __init__(self, pool, func, args, kwargs, done=None, error=None, progress=None, writes=True):
+        self.logger = get_logger(self)
+        self.pool = pool
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.done = done
+        self.error = error
+        self.progress = progress
+        # When the task writes to the database the GUI's caches are dropped when it ends.
+        self.writes = writes
+
+        self.cancelled = threading.Event()
+        self.finished = False
+        self.lock = threading.Lock()
+        self.progress_args = None
+
+    def cancel(self):
+        '''
+        Ask the task to stop. It stops the next time that it calls check().
+        '''
+        self.cancelled.set()
+
+    def check(self):
+        '''
+        Called by the function in the worker. Raises TaskCancelled if the task has
+        been cancelled.
+        '''
+        if self.cancelled.is_set():
+            raise TaskCancelled('The task was cancelled.')
+
+    def report(self, *args):
+        '''
+        Called by the function in the worker to send progress to the GUI. If the GUI
+        has not taken the last report yet, then it is replaced by this one, so a task
+        can report as often as it likes.
+        '''
+        if self.progress is None:
+            return
+
+        with self.lock:
+            pending = not self.progress_args is None
+            self.progress_args = args
+
+        if not pending:
+            self.pool.post(self.show_progress, ())
+
+    def show_progress(self):
+        with self.lock:
+            args = self.progress_args
+            self.progress_args = None
+
+        if not args is None and not self.finished:
+            self.progress(*args)
+
+    def run(self, data):
+        '''
+        Run the function in the worker thread and post the result to the GUI.
+        '''
+        try:
+            self.check()
+            result = self.func(self, data, *self.args, **self.kwargs)
+        except Exception as e:
+            if not isinstance(e, TaskCancelled):
+                self.logger.error("task failed: %s", traceback.format_exc())
+            self.pool.post(self.finish, (None, e))
+        else:
+            self.pool.post(self.finish, (result, None))
+
+    def finish(self, result, exc):
+        '''
+        Called in the GUI thread when the function has returned or raised.
+        '''
+        self.finished = True
+        self.pool.active -= 1
+        if self.writes:
+            Database.get_instance().invalidate_all()
+
+        if exc is None:
+            if not self.done is None:
+                self.done(result)
+        elif not self.error is None:
+            self.error(exc)
+
+class WorkerPool(object):
+    '''
+    A small pool of threads that run Tasks so that long jobs do not freeze the GUI.
+    Every worker has its own database connection. The results and progress of tasks
+    are put on a queue that the GUI thread reads with after(), so the callbacks are
+    run in the GUI thread. set_master() has to be called with a widget before any
+    task is submitted.
+    '''
+
+    __instance = None
+
+    @staticmethod
+    def get_instance():
+        '''
+        This static method is used to get the singleton object for this class.
+        '''
+        if WorkerPool.__instance == None:
+            WorkerPool()
+        return WorkerPool.__instance
+
+    def __init__(self, size=2, interval=50):
+
+        # gate the access to __init__()
+        if WorkerPool.__instance != None:
+            raise Exception("WorkerPool class is a singleton. Use get_instance() instead.")
+        else:
+            WorkerPool.__instance = self
+
+        self.logger = get_logger(self)
+        self.logger.debug("enter constructor")
+
+        self.master = None
+        self.interval = interval # ms between reads of the result queue
+        self.polling = None
+        self.active = 0 # tasks that have not finished
+        self.tasks = queue.Queue()
+        self.results = queue.Queue()
+
+        self.threads = []
+        for x in range(size):
+            thread = threading.Thread(target=self.worker, name='Worker-%d'%(x), daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+        self.logger.debug("leave constructor")
+
+    @debugger
+    def set_master(self, master):
+        '''
+        Set the widget whose after() is used to read the results.
+        '''
+        self.master = master
+
+    @debugger
+    def submit(self, func, *args, done=None, error=None, progress=None, writes=True, **kwargs):
+        '''
+        Run func(task, data, *args, **kwargs) in a worker and return the Task. See the
+        Task class for the callbacks.
+        '''
+        if self.master is None:
+            raise Exception("WorkerPool.set_master() has to be called before a task is submitted.")
+
+        task = Task(self, func, args, kwargs, done, error, progress, writes)
+        self.active += 1
+        self.tasks.put(task)
+        self.schedule()
+        return task
+
+    @debugger
+    def shutdown(self):
+        '''
+        Stop the workers after the tasks that are queued have run.
+        '''
+        for thread in self.threads:
+            self.tasks.put(None)
+
+    def worker(self):
+        '''
+        Worker thread. The database connection is opened when the first task is run.
+        '''
+        data = None
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                break
+            data = self.run_task(task, data)
+
+        if not data is None:
+            data.close()
+
+    def run_task(self, task, data):
+        '''
+        Run a task in a worker with the worker's database connection, which is opened
+        for the first task. If it cannot be opened, then the task fails with that error
+        and the next task tries again. Returns the connection.
+        '''
+        if data is None:
+            try:
+                data = Database.worker_instance()
+            except Exception as e:
+                self.logger.error("cannot open the database for a worker: %s", traceback.format_exc())
+                self.post(task.finish, (None, e))
+                return None
+
+        task.run(data)
+        return data
+
+    def post(self, func, args):
+        '''
+        Queue a call to be made in the GUI thread.
+        '''
+        self.results.put((func, args))
+
+    def schedule(self):
+        if self.polling is None:
+            self.polling = self.master.after(self.interval, self.poll)
+
+    def poll(self):
+        '''
+        Make the calls that the workers have queued. This keeps polling as long as
+        there are tasks that have not finished.
+        '''
+        self.polling = None
+        while True:
+            try:
+                func, args = self.results.get_nowait()
+            except queue.Empty:
+                break
+
+            try:
+                func(*args)
+            except Exception:
+                self.logger.error("task callback failed: %s", traceback.format_exc())
+
+        if self.active > 0:
+            self.schedule()